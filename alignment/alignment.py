@@ -1,157 +1,1894 @@
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import tracemalloc
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from time import perf_counter
+
 import numpy as np
 
+MODES = ('global', 'local', 'semiglobal')
+ENGINES = ('full', 'wavefront', 'linear_space', 'tiled', 'xdrop')
+OUTPUTS = ('strings', 'cigar')
+SCORE_ENGINES = ('auto', 'four_russians')
+
+
+class AlignmentResult(tuple):
+    # (score, aligned1, aligned2) as before, with the aligned coordinates
+    # (seq1Start, seq1End, seq2Start, seq2End) in region, the number of
+    # matrix cells the engine computed in cells, the edit script in cigar and,
+    # when align was asked to profile, the per-phase measurements in phases
+    def __new__(cls, score, aligned1, aligned2, region, cells=0, cigar=None, phases=None):
+        result = super().__new__(cls, (score, aligned1, aligned2))
+        result.region = region
+        result.cells = cells
+        result.cigar = cigar
+        result.phases = phases
+        return result
+
+    def __reduce__(self):
+        return AlignmentResult, (*self, self.region, self.cells, self.cigar, self.phases)
+
+
 def align(
-        seq1: str,
-        seq2: str,
+        seq1: str | bytes,
+        seq2: str | bytes,
         match_award=-3,
         indel_penalty=5,
         sub_penalty=1,
         banded_width=-1,
         gap_open_penalty=0,
         gap='-',
-) -> tuple[float, str | None, str | None]:
+        engine='full',
+        workers=None,
+        substitution_matrix=None,
+        mode='global',
+        x_drop=200,
+        output='strings',
+        checkpoint_dir=None,
+        max_cost=None,
+        profile=False,
+) -> AlignmentResult:
     """
         Align seq1 against seq2 using Needleman-Wunsch
         Put seq1 on left (j) and seq2 on top (i)
         => matrix[i][j]
-        :param seq1: the first sequence to align; should be on the "left" of the matrix
+        :param seq1: the first sequence to align; should be on the "left" of the matrix.
+            Sequences may be str or a bytes-like buffer such as sequence_loader returns
         :param seq2: the second sequence to align; should be on the "top" of the matrix
         :param match_award: how many points to award a match
         :param indel_penalty: how many points to award a gap in either sequence
         :param sub_penalty: how many points to award a substitution
-        :param banded_width: banded_width * 2 + 1 is the width of the banded alignment; -1 indicates full alignment
+        :param banded_width: banded_width * 2 + 1 is the width of the banded alignment; -1 indicates full alignment.
+            "auto" derives it from k-mer seeds with choose_band
         :param gap_open_penalty: how much it costs to open a gap. If 0, there is no gap_open penalty
         :param gap: the character to use to represent gaps in the alignment strings
+        :param engine: "full" fills the matrix row by row; "wavefront" sweeps anti-diagonals
+            as vector operations and gives the same result much faster on long sequences.
+            "linear_space" finds the same alignment in O(n + m) memory by divide and conquer.
+            "tiled" splits the matrix into tiles and fills each block anti-diagonal of tiles in parallel.
+            "xdrop" sweeps anti-diagonals but keeps only cells within x_drop of the best cost on their
+            anti-diagonal, so the work follows the alignment instead of a fixed band.
+            It is a heuristic: the score may be above the optimum when the path strays.
+            Banded and gap-open (affine) alignments use their own engines regardless of engine.
+            When the scores are equivalent to unit-cost edit distance (match_award == 2 * sub_penalty
+            - 2 * indel_penalty and sub_penalty < 2 * indel_penalty) and there is no substitution_matrix,
+            "full" uses a bit-parallel engine
+        :param workers: number of worker processes for the tiled engine; defaults to the CPU count
+        :param substitution_matrix: a mapping from (residue1, residue2) to the cost of aligning them,
+            such as substitution_matrices.BLOSUM62. Lowercase residues fall back to the uppercase entry;
+            pairs missing from it cost match_award or sub_penalty as usual
+        :param mode: "global" aligns both sequences end to end. "local" (Smith-Waterman) finds the
+            lowest-cost pair of substrings; "semiglobal" makes gaps before and after either sequence
+            free, e.g. to place a short read inside a genome. Both run on the full, wavefront
+            and banded engines with linear gap costs
+        :param x_drop: how far above the best cost on its anti-diagonal a cell may be before the xdrop
+            engine drops it. If every path to the end is dropped the score is inf, as for a too narrow band
+        :param output: "strings" builds both aligned strings; "cigar" leaves them None and only returns
+            the edit script, which aligned_chunks can expand piece by piece
+        :param checkpoint_dir: a directory for the tiled engine to keep its matrices in as memory-mapped
+            files, so they may be larger than RAM. Progress is checkpointed there as block anti-diagonals
+            of tiles finish; calling align again with the same arguments after an interruption resumes
+            from the last checkpoint. The files are removed once the alignment is done
+        :param max_cost: only report alignments costing at most this much, for screening. A global alignment
+            on the full, wavefront or banded engine is abandoned as soon as no cell of the current row or
+            anti-diagonal can still finish under it (every 32 rows when the costs make the full engine an
+            edit distance); other engines and modes check the final cost
+        :param profile: True records the wall time of each phase of the call in the result's phases attribute:
+            "setup" (encoding and allocating the matrices), "costs", "traceback" and "output" (building the
+            strings). The costs phase also reports cells_per_second. "memory" adds each phase's peak memory,
+            measured with tracemalloc; tracing slows every engine several times over (the pure-Python
+            ones most), so take timings from a separate run. Engines that trace back as they go
+            (linear_space, tiled) count it all as costs
+        :return: the score and both aligned strings, or (inf, None, None) when no alignment
+            fits inside the band or under max_cost. The result's region attribute holds the aligned coordinates
+            (seq1Start, seq1End, seq2Start, seq2End), half-open; the strings cover only that region.
+            Its cells attribute counts the matrix cells the engine computed, and cigar holds the
+            alignment as run lengths of = (match), X (substitution), I (gap in seq1, a left step)
+            and D (gap in seq2, an up step)
     """
-    alignmentTemplate = buildTemplate(seq1, seq2)
-    alignmentDictionary = buildDictionary(alignmentTemplate)
-    computedCosts = calculateCosts(alignmentTemplate, alignmentDictionary, indel_penalty, match_award, sub_penalty)
-    finalCost = computedCosts[len(alignmentTemplate) - 1, len(alignmentTemplate[0]) - 1].getCost()
-    alignedSequence = buildStrings(alignmentTemplate, alignmentDictionary)
+    seq1, seq2 = matchSequenceTypes(seq1, seq2)
+    costType = chooseCostType(len(seq1) + len(seq2), match_award, indel_penalty, sub_penalty, gap_open_penalty,
+                              *matrixCosts(substitution_matrix))
+    rowCol = (len(seq1), len(seq2))
+    if banded_width == 'auto':
+        banded_width = choose_band(seq1, seq2)
 
-    return finalCost, alignedSequence[0], alignedSequence[1]
+    if gap_open_penalty and engine == 'linear_space':
+        raise ValueError('The linear_space engine only supports linear gap costs (gap_open_penalty=0)')
+    checkMode(mode, gap_open_penalty)
+    if mode != 'global' and engine in ('linear_space', 'tiled', 'xdrop'):
+        raise ValueError(f'The {engine} engine only supports global alignment')
+    if checkpoint_dir is not None and (engine != 'tiled' or banded_width >= 0 or gap_open_penalty):
+        raise ValueError('checkpoint_dir is only supported by the tiled engine without a band or gap_open_penalty')
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown alignment engine: {engine!r}')
+    if output not in OUTPUTS:
+        raise ValueError(f'Unknown alignment output: {output!r}')
 
+    profiler = PhaseProfiler(profile == 'memory') if profile else NO_PROFILER
+    if mode == 'global' and banded_width >= 0 and abs(len(seq1) - len(seq2)) > banded_width:
+        return profiler.finish(AlignmentResult(math.inf, None, None, None))
 
-def buildTemplate(seq1, seq2):
-    emptySquares = 2
+    codes1, codes2, table = buildScoring(seq1, seq2, costType, match_award, sub_penalty, substitution_matrix)
+    cells = bandCells(len(seq1), len(seq2), banded_width)
+    ceiling = None
+    if max_cost is not None and mode == 'global':
+        ceiling = CostCeiling(max_cost, codes1, codes2, indel_penalty, table)
 
-    alignmentTemplate = [[0] * (len(seq2) + emptySquares) for _ in range(len(seq1) + emptySquares)]
-    alignmentTemplate[0][2:] = list(seq2)
+    if gap_open_penalty:
+        if banded_width >= 0:
+            traceback = buildBandedDictionary(seq1, banded_width)
+        else:
+            traceback = buildDictionary(seq1, seq2)
+        profiler.lap('costs')
+        finalCost, layer = calculateAffineCosts(codes1, codes2, banded_width, traceback, indel_penalty,
+                                                table[:, codes2], gap_open_penalty)
+        profiler.lap('traceback')
+        path = buildAffineLoop(EditScript(), traceback, rowCol, layer, banded_width)
+        end = rowCol
 
-    iterator = 0
-    for i in range(2, len(seq1) + emptySquares):
-        alignmentTemplate[i][0] = seq1[iterator]
-        iterator += 1
+    elif banded_width >= 0:
+        costs = buildBandedTemplate(seq1, banded_width, costType)
+        directions = buildBandedDictionary(seq1, banded_width)
+        profiler.lap('costs')
+        if calculateBandedCosts(codes1, codes2, banded_width, costs, directions, indel_penalty, table[:, codes2],
+                                mode, ceiling) is None:
+            return profiler.finish(AlignmentResult(math.inf, None, None, None, ceiling.cells))
+        finalCost, end = alignmentEnd(costs, rowCol, mode, banded_width)
+        profiler.lap('traceback')
+        path = buildLoop(EditScript(), directions, end, banded_width)
 
-    return alignmentTemplate
+    elif (engine == 'full' and mode == 'global' and substitution_matrix is None
+          and editDistanceScale(match_award, indel_penalty, sub_penalty)):
+        profiler.lap('costs')
+        if max_cost is not None:
+            ceiling = editDistanceCeiling(max_cost, len(seq1), len(seq2), match_award, indel_penalty, sub_penalty)
+        editDistance, rowDeltas = calculateEditDistance(seq1, seq2, keepRows=True, ceiling=ceiling)
+        if rowDeltas is None:
+            return profiler.finish(AlignmentResult(math.inf, None, None, None, ceiling.cells))
+        finalCost = editDistanceToCost(editDistance, len(seq1) + len(seq2), match_award, indel_penalty, sub_penalty)
+        profiler.lap('traceback')
+        path = buildEditDistanceLoop(EditScript(), seq1, seq2, rowDeltas)
+        end = rowCol
 
+    elif engine == 'linear_space':
+        profiler.lap('costs')
+        path, cells, finalCost = buildLinearSpaceLoop(EditScript(), codes1, codes2, costType, indel_penalty, table)
+        end = rowCol
 
-def buildDictionary(alignmentTemplate):
-    alignmentDictionary = {}
-    for row in range(len(alignmentTemplate)):
-        for col in range(len(alignmentTemplate[0])):
-            alignmentDictionary[(row, col)] = CellData(0, "", alignmentTemplate[row][col], False)
+    elif engine == 'tiled':
+        profiler.lap('costs')
+        finalCost, path = calculateCostsTiled(codes1, codes2, costType, indel_penalty, table,
+                                              workers or os.cpu_count() or 1, checkpoint_dir)
+        end = rowCol
 
-    return alignmentDictionary
+    elif engine == 'xdrop':
+        profiler.lap('costs')
+        finalCost, diagonals, cells = calculateCostsXDrop(codes1, codes2, indel_penalty, table, x_drop)
+        if finalCost == math.inf:
+            return profiler.finish(AlignmentResult(math.inf, None, None, None, cells))
+        finalCost = costType(finalCost).item()
+        profiler.lap('traceback')
+        path = buildXDropLoop(EditScript(), diagonals, rowCol)
+        end = rowCol
 
+    else:
+        directions = PackedTraceback(codes1, codes2)
+        profiler.lap('costs')
+        if engine == 'full':
+            finalCost, end = calculateCosts(codes1, codes2, directions, indel_penalty, table[:, codes2], mode,
+                                            ceiling)
+        else:
+            finalCost, end = calculateCostsWavefront(codes1, codes2, directions, costType, indel_penalty, table,
+                                                     mode, ceiling)
+        if end is None:
+            return profiler.finish(AlignmentResult(math.inf, None, None, None, ceiling.cells))
+        profiler.lap('traceback')
+        path = buildLoop(EditScript(), directions, end)
 
-def calculateCosts(alignmentTemplate, alignmentDictionary, indel_penalty, match_award, sub_penalty):
-    for row in range(1, len(alignmentTemplate)):
-        for col in range(1, len(alignmentTemplate[0])):
-            match = False
-            currentCell = (row, col)
-            topCellCost = alignmentDictionary[(row - 1, col)].getCost() + indel_penalty
-            leftCellCost = alignmentDictionary[(row, col - 1)].getCost() + indel_penalty
+    profiler.lap('output')
+    if max_cost is not None and finalCost > max_cost:
+        return profiler.finish(AlignmentResult(math.inf, None, None, None, cells))
+    region = path.region(end)
+    cigar = path.cigar()
+    if output == 'strings':
+        alignedSequence = buildStrings(seq1, seq2, cigar, region, gap)
+    else:
+        alignedSequence = (None, None)
+    if costType is np.float64:
+        finalCost = float(finalCost)
+
+    return profiler.finish(AlignmentResult(finalCost, alignedSequence[0], alignedSequence[1], region, cells, cigar))
+
+
+def align_score(
+        seq1: str | bytes,
+        seq2: str | bytes,
+        match_award=-3,
+        indel_penalty=5,
+        sub_penalty=1,
+        banded_width=-1,
+        gap_open_penalty=0,
+        substitution_matrix=None,
+        mode='global',
+        max_cost=None,
+        engine='auto',
+) -> float:
+    """
+        Compute only the score that align would return, without any traceback.
+        Two rolling rows are kept, over the shorter sequence, so memory is O(min(n, m))
+        (O(banded_width) rows when banded, beside the O(min(n, m)) query profile).
+        :param seq1: the first sequence to align
+        :param seq2: the second sequence to align
+        :param match_award: how many points to award a match
+        :param indel_penalty: how many points to award a gap in either sequence
+        :param sub_penalty: how many points to award a substitution
+        :param banded_width: banded_width * 2 + 1 is the width of the banded alignment; -1 indicates full alignment.
+            "auto" derives it from k-mer seeds with choose_band
+        :param gap_open_penalty: how much it costs to open a gap. If 0, there is no gap_open penalty
+        :param substitution_matrix: a mapping from (residue1, residue2) to the cost of aligning them, as for align
+        :param mode: "global", "local" or "semiglobal", as for align
+        :param max_cost: as for align; global alignments with linear gap costs stop early once it cannot be met
+        :param engine: "auto" picks the kernel from the scoring. "four_russians" looks whole blocks of the
+            matrix up in precomputed tables; it needs a global alignment with no band, linear gap costs and
+            no substitution matrix, where a substitution costs the same as a match or as one or two gaps
+            do against a match (2 * indel_penalty - match_award against 2 * (sub_penalty - match_award))
+        :return: the alignment score, or inf when no alignment fits inside the band or under max_cost
+    """
+    checkMode(mode, gap_open_penalty)
+    if engine not in SCORE_ENGINES:
+        raise ValueError(f'Unknown score engine: {engine!r}')
+    weights = fourRussiansWeight(match_award, indel_penalty, sub_penalty)
+    if engine == 'four_russians' and (mode != 'global' or banded_width != -1 or gap_open_penalty
+                                      or substitution_matrix is not None or weights is None):
+        raise ValueError('The four_russians engine needs a global, unbanded alignment with linear gap costs '
+                         'and a substitution weighing the same as a match or one or two gaps')
+    if banded_width == 'auto':
+        banded_width = choose_band(seq1, seq2)
+    if mode == 'global' and banded_width >= 0 and abs(len(seq1) - len(seq2)) > banded_width:
+        return math.inf
+
+    seq1, seq2 = matchSequenceTypes(seq1, seq2)
+    costType = chooseCostType(len(seq1) + len(seq2), match_award, indel_penalty, sub_penalty, gap_open_penalty,
+                              *matrixCosts(substitution_matrix))
+    codes1, codes2, table = buildScoring(seq1, seq2, costType, match_award, sub_penalty, substitution_matrix)
+    # Both gap directions cost the same, so the shorter sequence can go on top
+    # (a substitution matrix is transposed to match)
+    if len(seq2) > len(seq1):
+        seq1, seq2 = seq2, seq1
+        codes1, codes2, table = codes2, codes1, table.T
+
+    if engine == 'four_russians':
+        substitutionWeight, gapWeight = weights
+        distance = calculateFourRussians(codes1, codes2, len(table), substitutionWeight)
+        score = (match_award * (len(seq1) + len(seq2)) + gapWeight * distance) / 2
+    elif gap_open_penalty:
+        score = calculateAffineScore(codes1, codes2, banded_width, indel_penalty, table, gap_open_penalty)
+    elif (banded_width < 0 and mode == 'global' and substitution_matrix is None
+          and editDistanceScale(match_award, indel_penalty, sub_penalty)):
+        ceiling = None
+        if max_cost is not None:
+            ceiling = editDistanceCeiling(max_cost, len(seq1), len(seq2), match_award, indel_penalty, sub_penalty)
+        editDistance, _ = calculateEditDistance(seq1, seq2, ceiling=ceiling)
+        if editDistance == math.inf:
+            return math.inf
+        score = editDistanceToCost(editDistance, len(seq1) + len(seq2), match_award, indel_penalty, sub_penalty)
+    else:
+        ceiling = None
+        if max_cost is not None and mode == 'global':
+            ceiling = CostCeiling(max_cost, codes1, codes2, indel_penalty, table)
+        score = calculateScore(codes1, codes2, banded_width, indel_penalty, table, mode, ceiling)
+
+    if max_cost is not None and score > max_cost:
+        return math.inf
+    if costType is np.float64:
+        return float(score)
+    return int(score)
+
+
+def choose_band(seq1: str | bytes, seq2: str | bytes, kmer_size=11, margin=16, max_occurrences=16) -> int:
+    """
+        Pick banded_width from exact k-mer seeds instead of by hand.
+        The k-mers of seq2 are hashed into a sorted index and every k-mer of seq1 is looked up in it.
+        The longest chain of seeds that moves forward in both sequences stands in for the alignment
+        path, and the band is the widest diagonal it reaches (both corners included) plus margin.
+        :param seq1: the first sequence to align
+        :param seq2: the second sequence to align
+        :param kmer_size: seed length; 11 suits nucleotides, proteins want about 3
+        :param margin: extra diagonals on each side of the chain
+        :param max_occurrences: k-mers seen more often than this in seq2 are repeats and are not used as seeds
+        :return: a banded_width for align, or -1 (full alignment) when no seeds chain
+            or the band would cover the whole matrix
+    """
+    seq1, seq2 = matchSequenceTypes(seq1, seq2)
+    rows, cols = findSeeds(encodeSequence(seq1), encodeSequence(seq2), kmer_size, max_occurrences)
+    chain = chainSeeds(rows, cols)
+    if not len(chain):
+        return -1
+
+    diagonals = cols[chain] - rows[chain]
+    band = max(-int(diagonals.min()), int(diagonals.max()), abs(len(seq2) - len(seq1))) + margin
+    return band if band < max(len(seq1), len(seq2)) else -1
+
+
+def align_many(pairs, workers=None, chunk_size=16, score_only=False, **params):
+    """
+        Align many (seq1, seq2) pairs across a pool of worker processes.
+        Pairs are sent in chunks of chunk_size to keep inter-process overhead low, and at most
+        two chunks per worker are in flight, so very long (even lazy) pair lists use bounded memory.
+        :param pairs: an iterable of (seq1, seq2) tuples
+        :param workers: number of worker processes; defaults to the CPU count. 1 aligns in this process
+        :param chunk_size: how many pairs each worker task aligns
+        :param score_only: use align_score instead of align
+        :param params: any keyword arguments accepted by align (or align_score)
+        :return: a generator of results in the same order as pairs
+    """
+    workers = workers or os.cpu_count() or 1
+    pairs = iter(pairs)
+    chunks = iter(lambda: list(islice(pairs, chunk_size)), [])
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from alignChunk(chunk, score_only, params)
+        return
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(alignChunk, chunk, score_only, params))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def alignChunk(chunk, scoreOnly, params):
+    aligner = align_score if scoreOnly else align
+    return [aligner(seq1, seq2, **params) for seq1, seq2 in chunk]
+
+
+# Traceback codes stored one byte per cell. The numeric order of the three
+# directions is the tie-breaking order: diagonal, then left, then up.
+STOP = 0
+DIAGONAL = 1
+LEFT = 2
+UP = 3
+DIRECTION_MASK = 3
+MATCH = 4
+
+# Affine traceback packs the source layer of all three Gotoh layers into one
+# byte: the match layer (reached by a diagonal step) in bits 0-1, the insert
+# layer (left step) in bits 2-3 and the delete layer (up step) in bits 4-5.
+# Layers are named by the direction code of the step that enters them.
+INSERT_SHIFT = 2
+DELETE_SHIFT = 4
+AFFINE_MATCH = 64
+
+# Checkpointed tiled runs keep tiles small enough that a checkpoint is never
+# far behind, and write one at most this often
+CHECKPOINT_TILE_SIZE = 4096
+CHECKPOINT_SECONDS = 60
+CHECKPOINT_PROGRESS = 'progress.json'
+CHECKPOINT_FILES = ('directions.bin', 'row_boundaries.bin', 'col_boundaries.bin')
+
+# The edit-distance engine keeps its rows packed into bit vectors, so under
+# max_cost it unpacks one to check against the ceiling only this often
+EDIT_DISTANCE_CHECK_ROWS = 32
+
+# The Four-Russians engine works on square blocks of this many residues a
+# side; its lookup tables, one per substitution weight, are built on first
+# use and kept for the life of the process
+FOUR_RUSSIANS_BLOCK = 3
+FOUR_RUSSIANS_TABLES = {}
+
+
+def chooseCostType(pathLength, *penalties):
+    if not all(isinstance(penalty, (int, np.integer)) for penalty in penalties):
+        return np.float64
+
+    # Twice the worst path cost leaves headroom for the offsets used by scanRow
+    worstCost = 2 * pathLength * max((abs(penalty) for penalty in penalties), default=0)
+    if worstCost < np.iinfo(np.int32).max:
+        return np.int32
+    return np.int64
+
+
+def unreachableCost(costType):
+    if np.issubdtype(costType, np.floating):
+        return math.inf
+    return int(np.iinfo(costType).max)
+
+
+def checkMode(mode, gap_open_penalty):
+    if mode not in MODES:
+        raise ValueError(f'Unknown alignment mode: {mode!r}')
+    if mode != 'global' and gap_open_penalty:
+        raise ValueError('Local and semi-global modes only support linear gap costs (gap_open_penalty=0)')
+
+
+def bandCells(rows, cols, band=-1):
+    # Cells below row 0 and right of column 0 that an engine fills, in full or within the band
+    if band < 0:
+        return rows * cols
+    row = np.arange(1, rows + 1)
+    return int(np.maximum(np.minimum(cols, row + band) - np.maximum(1, row - band) + 1, 0).sum())
+
+
+def matrixCosts(substitution_matrix):
+    return list(substitution_matrix.values()) if substitution_matrix else []
+
+
+def buildScoring(seq1, seq2, costType, match_award, sub_penalty, substitution_matrix=None):
+    # Both sequences become codes into their shared alphabet (uint8 unless it
+    # has more than 256 residues), and table[code1, code2] is the cost of a
+    # diagonal step. table[:, codes2] is the query profile: one precomputed row
+    # of diagonal costs for each residue that can occur in seq1.
+    encoded1 = encodeSequence(seq1)
+    encoded2 = encodeSequence(seq2)
+    alphabet, codes = np.unique(np.concatenate((encoded1, encoded2)), return_inverse=True)
+    codes = codes.astype(np.uint8 if len(alphabet) <= 256 else np.uint16)
+    table = scoringTable(alphabet, costType, match_award, sub_penalty, substitution_matrix)
+    return codes[:len(encoded1)], codes[len(encoded1):], table
+
+
+def scoringTable(alphabet, costType, match_award, sub_penalty, substitution_matrix=None):
+    # table[code1, code2] for residues given as code points, in alphabet order
+    table = np.full((len(alphabet), len(alphabet)), sub_penalty, dtype=costType)
+    np.fill_diagonal(table, match_award)
+    if substitution_matrix:
+        residues = [chr(code) for code in alphabet.tolist()]
+        for code1, residue1 in enumerate(residues):
+            for code2, residue2 in enumerate(residues):
+                cost = substitution_matrix.get((residue1, residue2),
+                                               substitution_matrix.get((residue1.upper(), residue2.upper())))
+                if cost is not None:
+                    table[code1, code2] = cost
+    return table
+
+
+def buildDictionary(seq1, seq2):
+    return np.zeros((len(seq1) + 1, len(seq2) + 1), dtype=np.uint8)
+
+
+class PackedTraceback:
+    # Full-matrix traceback at 2 bits per cell: four cells per byte, each row
+    # padded to whole bytes so rows never share a byte. STOP, DIAGONAL, LEFT
+    # and UP fit in the 2 bits; the MATCH flag is not stored but recomputed
+    # from the residue codes when a cell is read, so indexing returns the same
+    # codes as the one-byte-per-cell matrix and buildLoop reads either.
+    def __init__(self, codes1, codes2):
+        self.codes1 = codes1
+        self.codes2 = codes2
+        self.shape = (len(codes1) + 1, len(codes2) + 1)
+        self.packed = np.zeros((self.shape[0], (self.shape[1] + 3) // 4), dtype=np.uint8)
+
+    def setRow(self, row, directions):
+        self.packed[row] = packCells(directions, self.packed.shape[1])
+
+    def setCells(self, rows, cols, directions):
+        # Cells in distinct rows (an anti-diagonal) never share a byte
+        flat = self.packed.reshape(-1)
+        index = rows * self.packed.shape[1] + (cols >> 2)
+        flat[index] |= directions.astype(np.uint8) << ((cols & 3) << 1).astype(np.uint8)
+
+    def __getitem__(self, index):
+        row, col = index
+        code = (int(self.packed[row, col >> 2]) >> ((col & 3) << 1)) & DIRECTION_MASK
+        if code == DIAGONAL and self.codes1[row - 1] == self.codes2[col - 1]:
+            code |= MATCH
+        return code
+
+
+def packCells(directions, width):
+    # Direction codes packed four to a byte into width bytes, first cell in the low bits
+    cells = np.zeros(4 * width, dtype=np.uint8)
+    cells[:len(directions)] = directions
+    cells &= DIRECTION_MASK
+    quads = cells.reshape(-1, 4)
+    return quads[:, 0] | quads[:, 1] << 2 | quads[:, 2] << 4 | quads[:, 3] << 6
+
+
+def calculateCosts(codes1, codes2, directions, indel_penalty, profile, mode='global', ceiling=None):
+    # Only the previous row of costs is kept; directions holds the rest. The end
+    # cell of a local or semi-global alignment is tracked along the way.
+    rows, cols = directions.shape
+    allColumns = np.arange(cols)
+    edgePenalty = indel_penalty if mode == 'global' else 0
+    previousRow = [col * edgePenalty for col in range(cols)]
+    directions.setRow(0, [STOP] + [LEFT if mode == 'global' else STOP] * (cols - 1))
+    lastColumn = [previousRow[-1]]
+    best = (0, 0, 0)
+
+    for row in range(1, rows):
+        substitution = profile[codes1[row - 1]].tolist()
+        currentRow = [row * edgePenalty] * cols
+        currentDirections = bytearray(cols)
+        currentDirections[0] = UP if mode == 'global' else STOP
+
+        for col in range(1, cols):
+            topCellCost = previousRow[col] + indel_penalty
+            leftCellCost = currentRow[col - 1] + indel_penalty
+            diagonalCellCost = previousRow[col - 1] + substitution[col - 1]
+
+            lowestCost, direction = sortCosts(topCellCost, leftCellCost, diagonalCellCost)
+            if mode == 'local' and lowestCost >= 0:
+                lowestCost, direction = 0, STOP
+            currentRow[col] = lowestCost
+            currentDirections[col] = direction
+
+        directions.setRow(row, np.frombuffer(currentDirections, dtype=np.uint8))
+        if ceiling and ceiling.exceeded(ceiling.lowest(currentRow, row, allColumns), row * (cols - 1)):
+            return math.inf, None
+        previousRow = currentRow
+        lastColumn.append(currentRow[-1])
+        if mode == 'local':
+            lowestCost = min(currentRow)
+            if lowestCost < best[0]:
+                best = (lowestCost, row, currentRow.index(lowestCost))
+
+    if mode == 'local':
+        return best[0], best[1:]
+    if mode == 'semiglobal':
+        return semiGlobalEnd(np.array(previousRow), np.array(lastColumn))
+    return previousRow[-1], (rows - 1, cols - 1)
 
-            if alignmentDictionary[(0, col)].getName() == alignmentDictionary[(row, 0)].getName() and row != 1 and col != 1:
-                diagonalCellCost = alignmentDictionary[(row - 1, col - 1)].getCost() + match_award
-                match = True
-            else:
-                diagonalCellCost = alignmentDictionary[(row - 1, col - 1)].getCost() + sub_penalty
 
+def buildBandedTemplate(seq1, band, costType=np.int64):
+    # Row r of the strip holds columns r - band .. r + band of the full matrix,
+    # so cell (row, col) lives at strip column col - row + band.
+    return np.full((len(seq1) + 1, 2 * band + 1), unreachableCost(costType), dtype=costType)
 
-            if row == 1 and col != 1:
-                alignmentDictionary[currentCell] = CellData(leftCellCost, "left", "-", False)
-                alignmentTemplate[currentCell[0]][currentCell[1]] = leftCellCost
 
-            if col == 1 and row != 1:
-                alignmentDictionary[currentCell] = CellData(topCellCost, "up", "-", False)
-                alignmentTemplate[currentCell[0]][currentCell[1]] = topCellCost
+def buildBandedDictionary(seq1, band):
+    return np.zeros((len(seq1) + 1, 2 * band + 1), dtype=np.uint8)
 
-            elif row != 1 and col != 1:
-                lowestCost = sortCosts([(topCellCost, "up"), (leftCellCost, "left"), (diagonalCellCost, "diagonal")])
-                alignmentDictionary[currentCell] = CellData(lowestCost[0], lowestCost[1], "-", match)
-                alignmentTemplate[currentCell[0]][currentCell[1]] = lowestCost[0]
 
-    return alignmentDictionary
+def calculateBandedCosts(codes1, codes2, band, costs, directions, indel_penalty, profile, mode='global',
+                         ceiling=None):
+    # Returns costs, or None when the ceiling abandons the alignment
+    rows = len(codes1)
+    cols = len(codes2)
+    width = 2 * band + 1
+    unreachable = unreachableCost(costs.dtype)
+    codes2 = codes2.tolist()
+    edgePenalty = indel_penalty if mode == 'global' else 0
 
+    previousRow = [unreachable] * width
+    for col in range(min(cols, band) + 1):
+        previousRow[col + band] = col * edgePenalty
+    costs[0] = previousRow
+    directions[0, band + 1:band + min(cols, band) + 1] = LEFT if mode == 'global' else STOP
 
-def buildStrings(alignmentTemplate, alignmentDictionary):
-    path = []
-    alignedSequence1 = ""
-    alignedSequence2 = ""
-    rowCol = (len(alignmentTemplate) - 1, len(alignmentTemplate[0]) - 1)
-    path = buildLoop(path, alignmentDictionary, rowCol)
-    path.reverse()
+    computed = 0
+    for row in range(1, rows + 1):
+        residue = int(codes1[row - 1])
+        firstCol = max(0, row - band)
+        lastCol = min(cols, row + band)
+        substitution = rowSubstitution(profile, residue, firstCol, lastCol)
+        currentRow = [unreachable] * width
+        currentDirections = bytearray(width)
 
-    for cellDataSet in path:
-        if cellDataSet[0] == "diagonal":
-            alignedSequence1 += alignmentDictionary[cellDataSet[2][0], 0].getName()
-            alignedSequence2 += alignmentDictionary[0, cellDataSet[2][1]].getName()
+        for col in range(firstCol, lastCol + 1):
+            stripCol = col - row + band
+            if col == 0:
+                currentRow[stripCol] = row * edgePenalty
+                currentDirections[stripCol] = UP if mode == 'global' else STOP
+                continue
 
-        elif cellDataSet[0] == "up":
-            alignedSequence1 += alignmentDictionary[cellDataSet[2][0], 0].getName()
-            alignedSequence2 += "-"
+            # Neighbours that fall outside the band keep the unreachable cost
+            topCellCost = previousRow[stripCol + 1] + indel_penalty if stripCol + 1 < width else unreachable
+            leftCellCost = currentRow[stripCol - 1] + indel_penalty if stripCol > 0 else unreachable
+            diagonalCellCost = previousRow[stripCol] + substitution[col - firstCol]
 
-        elif cellDataSet[0] == "left":
-            alignedSequence1 += "-"
-            alignedSequence2 += alignmentDictionary[0, cellDataSet[2][1]].getName()
+            lowestCost, direction = sortCosts(topCellCost, leftCellCost, diagonalCellCost)
+            if mode == 'local' and lowestCost >= 0:
+                lowestCost, direction = 0, STOP
+            currentRow[stripCol] = lowestCost
+            if direction == DIAGONAL and residue == codes2[col - 1]:
+                direction |= MATCH
+            currentDirections[stripCol] = direction
 
-    return alignedSequence1, alignedSequence2
+        costs[row] = currentRow
+        directions[row] = np.frombuffer(currentDirections, dtype=np.uint8)
+        computed += lastCol - max(firstCol, 1) + 1
+        if ceiling and ceiling.exceeded(ceiling.lowest(currentRow[firstCol - row + band:lastCol - row + band + 1],
+                                                       row, np.arange(firstCol, lastCol + 1)), computed):
+            return None
+        previousRow = currentRow
 
-def buildLoop(path, alignmentDictionary, rowCol):
+    return costs
+
+
+def rowSubstitution(profile, residue, firstCol, lastCol):
+    # Diagonal costs into columns firstCol..lastCol of one row, as a list the
+    # cell loops index with col - firstCol (column 0 has no diagonal)
+    return [0] * (firstCol == 0) + profile[residue, max(0, firstCol - 1):lastCol].tolist()
+
+
+def calculateCostsWavefront(codes1, codes2, directions, costType, indel_penalty, table, mode='global',
+                            ceiling=None):
+    # Every cell on anti-diagonal d = row + col depends only on diagonals d - 1
+    # (up and left) and d - 2 (diagonal), so each diagonal is one vector step.
+    # The diagonals are indexed by row; only the last three are kept, so the
+    # end cell of a local or semi-global alignment is tracked along the way.
+    rows = len(codes1)
+    cols = len(codes2)
+    reversedCodes2 = codes2[::-1]
+    edgePenalty = indel_penalty if mode == 'global' else 0
+    if mode == 'global':
+        directions.setRow(0, [STOP] + [LEFT] * cols)
+        directions.setCells(np.arange(1, rows + 1), np.zeros(rows, dtype=np.intp), np.full(rows, UP))
+
+    beforePrevious = np.zeros(rows + 1, dtype=costType)
+    previous = np.zeros(rows + 1, dtype=costType)
+    current = np.zeros(rows + 1, dtype=costType)
+    lastRow = np.zeros(cols + 1, dtype=costType)
+    lastColumn = np.zeros(rows + 1, dtype=costType)
+    best = (0, 0, 0)
+    computed = 0
+    previousLowest = ceiling.lowest(0, 0, 0) if ceiling else None
+
+    for diagonal in range(1, rows + cols + 1):
+        beforePrevious, previous, current = previous, current, beforePrevious
+        if diagonal <= cols:
+            current[0] = diagonal * edgePenalty
+        if diagonal <= rows:
+            current[diagonal] = diagonal * edgePenalty
+
+        low = max(1, diagonal - cols)
+        high = min(rows, diagonal - 1)
+        if low <= high:
+            residues1 = codes1[low - 1:high]
+            residues2 = reversedCodes2[cols - diagonal + low:cols - diagonal + high + 1]
+            diagonalCellCost = beforePrevious[low - 1:high] + table[residues1, residues2]
+            leftCellCost = previous[low:high + 1] + indel_penalty
+            topCellCost = previous[low - 1:high] + indel_penalty
+
+            diagonalWins = (diagonalCellCost <= leftCellCost) & (diagonalCellCost <= topCellCost)
+            leftWins = ~diagonalWins & (leftCellCost <= topCellCost)
+            lowestCost = np.where(diagonalWins, diagonalCellCost, np.minimum(leftCellCost, topCellCost))
+            cellDirections = np.where(leftWins, np.uint8(LEFT), np.uint8(UP))
+            cellDirections[diagonalWins] = DIAGONAL
+            if mode == 'local':
+                stop = lowestCost >= 0
+                lowestCost[stop] = 0
+                cellDirections[stop] = STOP
+                lowest = int(np.argmin(lowestCost))
+                candidate = (lowestCost[lowest].item(), low + lowest, diagonal - low - lowest)
+                best = min(best, candidate)
+            current[low:high + 1] = lowestCost
+            cellRows = np.arange(low, high + 1)
+            directions.setCells(cellRows, diagonal - cellRows, cellDirections)
+            computed += high - low + 1
+
+        if ceiling:
+            first = max(0, diagonal - cols)
+            last = min(rows, diagonal)
+            cellRows = np.arange(first, last + 1)
+            lowest = ceiling.lowest(current[first:last + 1], cellRows, diagonal - cellRows)
+            if ceiling.exceeded(min(lowest, previousLowest), computed):
+                return math.inf, None
+            previousLowest = lowest
+
+        if diagonal >= cols:
+            lastColumn[diagonal - cols] = current[diagonal - cols]
+        if diagonal >= rows:
+            lastRow[diagonal - rows] = current[rows]
+
+    if mode == 'local':
+        return best[0], best[1:]
+    if mode == 'semiglobal':
+        return semiGlobalEnd(lastRow, lastColumn)
+    return (current[rows].item() if rows + cols else 0), (rows, cols)
+
+
+def calculateCostsXDrop(codes1, codes2, indel_penalty, table, xDrop):
+    # Anti-diagonal sweep like calculateCostsWavefront, but each diagonal only
+    # covers the rows reachable from the cells kept before it, and a cell is
+    # dropped once its cost is more than xDrop above the best cell of its own
+    # diagonal. Every cell of a diagonal has consumed the same number of
+    # residues, so their costs compare fairly; costs from earlier diagonals
+    # do not, and would drop the end of any alignment with a divergent tail.
+    # Costs are float64 so dropped neighbours read as inf. Each diagonal keeps
+    # (firstRow, directions) for the traceback.
+    rows = len(codes1)
+    cols = len(codes2)
+    diagonals = [(0, np.array([STOP], dtype=np.uint8))]
+    beforePrevious = previous = (0, np.zeros(1))
+    cells = 0
+
+    for diagonal in range(1, rows + cols + 1):
+        # a kept cell reaches the same row (left), the next row (up) and, two
+        # diagonals on, the next row again (diagonal step)
+        first = max(min(previous[0], beforePrevious[0] + 1), diagonal - cols)
+        last = min(max(previous[0] + len(previous[1]), beforePrevious[0] + len(beforePrevious[1])), rows, diagonal)
+        if first > last:
+            return math.inf, diagonals, cells
+        current = np.full(last - first + 1, math.inf)
+        directions = np.zeros(last - first + 1, dtype=np.uint8)
+
+        # cells in row 0 and column 0 are reached by gaps alone
+        if first == 0:
+            current[0] = diagonal * indel_penalty
+            directions[0] = LEFT
+        if last == diagonal:
+            current[-1] = diagonal * indel_penalty
+            directions[-1] = UP
+
+        low = max(first, 1)
+        high = min(last, diagonal - 1)
+        if low <= high:
+            inner = slice(low - first, high - first + 1)
+            residues1 = codes1[low - 1:high]
+            residues2 = codes2[diagonal - high - 1:diagonal - low][::-1]
+            matches = residues1 == residues2
+            diagonalCellCost = diagonalWindow(beforePrevious, low - 1, high - 1) + table[residues1, residues2]
+            leftCellCost = diagonalWindow(previous, low, high) + indel_penalty
+            topCellCost = diagonalWindow(previous, low - 1, high - 1) + indel_penalty
+
+            diagonalWins = (diagonalCellCost <= leftCellCost) & (diagonalCellCost <= topCellCost)
+            leftWins = ~diagonalWins & (leftCellCost <= topCellCost)
+            current[inner] = np.where(diagonalWins, diagonalCellCost, np.minimum(leftCellCost, topCellCost))
+            directions[inner] = np.where(diagonalWins, DIAGONAL | np.where(matches, MATCH, 0),
+                                         np.where(leftWins, LEFT, UP))
+            cells += high - low + 1
+
+        current[current > current.min() + xDrop] = math.inf
+        kept = np.nonzero(np.isfinite(current))[0]
+        if not len(kept):
+            return math.inf, diagonals, cells
+
+        start, stop = int(kept[0]), int(kept[-1]) + 1
+        beforePrevious, previous = previous, (first + start, current[start:stop])
+        diagonals.append((first + start, directions[start:stop]))
+
+    if previous[0] + len(previous[1]) - 1 != rows:
+        return math.inf, diagonals, cells
+    return previous[1][-1], diagonals, cells
+
+
+def diagonalWindow(diagonal, first, last):
+    # Costs of rows first..last of a sparse diagonal, inf where it was dropped
+    start, values = diagonal
+    window = np.full(last - first + 1, math.inf)
+    low = max(first, start)
+    high = min(last, start + len(values) - 1)
+    if low <= high:
+        window[low - first:high - first + 1] = values[low - start:high - start + 1]
+    return window
+
+
+def buildXDropLoop(path, diagonals, rowCol):
     row = rowCol[0]
     col = rowCol[1]
 
-    while row and col != 0:
-        currentCell = alignmentDictionary[(row, col)]
-        path.append((currentCell.getDirection(), currentCell.isMatch, (row, col)))
+    while row or col:
+        start, directions = diagonals[row + col]
+        code = int(directions[row - start])
+        direction = code & DIRECTION_MASK
+        path.append((direction, bool(code & MATCH), (row, col)))
+        if direction != LEFT:
+            row -= 1
+        if direction != UP:
+            col -= 1
+
+    return path
+
+
+class PhaseProfiler:
+    # Opt-in instrumentation for align. lap(name) ends the running phase and
+    # starts the next; finish(result) ends the last one and hangs the
+    # measurements on the result. Peak memory, when asked for, comes from
+    # tracemalloc, which is started for the call unless something else (a
+    # benchmark) is already tracing, and is counted above what was allocated
+    # when the call began.
+    def __init__(self, memory=False):
+        self.phases = {}
+        self.memory = memory
+        self.ownsTracing = memory and not tracemalloc.is_tracing()
+        if self.ownsTracing:
+            tracemalloc.start()
+        if memory:
+            self.baseline, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        self.phase = 'setup'
+        self.started = perf_counter()
+
+    def lap(self, phase):
+        self.phases[self.phase] = {'seconds': perf_counter() - self.started}
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            self.phases[self.phase]['peak_memory_bytes'] = max(0, peak - self.baseline)
+            tracemalloc.reset_peak()
+        self.phase = phase
+        self.started = perf_counter()
+
+    def finish(self, result):
+        self.lap(None)
+        if self.ownsTracing:
+            tracemalloc.stop()
+        costs = self.phases.get('costs')
+        if costs:
+            costs['cells_per_second'] = result.cells / costs['seconds'] if costs['seconds'] else None
+        result.phases = self.phases
+        return result
+
+
+class NullProfiler:
+    # Stands in for PhaseProfiler when profiling is off, so it costs a no-op call per phase
+    def lap(self, phase):
+        pass
+
+    def finish(self, result):
+        return result
+
+
+NO_PROFILER = NullProfiler()
+
+
+class CostCeiling:
+    # Early exit for global alignments under max_cost. Match costs may be
+    # negative, so a cell over the ceiling can still come back under it; what
+    # cannot is a cell whose cost plus the cheapest possible rest of the path
+    # (the shorter remainder at the cheapest diagonal step, the difference in
+    # gaps) is over it. Once that holds for a whole row, or for two consecutive
+    # anti-diagonals (a diagonal step skips one), no path gets under the ceiling.
+    def __init__(self, maxCost, codes1, codes2, indel_penalty, table):
+        self.maxCost = maxCost
+        self.rows = len(codes1)
+        self.cols = len(codes2)
+        self.indel_penalty = indel_penalty
+        self.diagonal = min(table.min().item(), 2 * indel_penalty) if table.size else 2 * indel_penalty
+        self.cells = None
+
+    def remaining(self, rows, cols):
+        rowsLeft = self.rows - rows
+        colsLeft = self.cols - cols
+        return np.minimum(rowsLeft, colsLeft) * self.diagonal + np.abs(rowsLeft - colsLeft) * self.indel_penalty
+
+    def lowest(self, costs, rows, cols):
+        # The least any path through the cells at (rows, cols) can finish at. Float64
+        # keeps the unreachable cost of integer strips from overflowing
+        return (np.asarray(costs, dtype=np.float64) + self.remaining(rows, cols)).min()
+
+    def exceeded(self, lowest, cells=None):
+        # cells is the work done so far, kept for the result
+        if lowest <= self.maxCost:
+            return False
+        self.cells = cells
+        return True
+
+
+def semiGlobalEnd(lastRow, lastColumn):
+    # Trailing gaps are free, so the alignment may end anywhere on the last row
+    # or column. As in the local search, ties go to the first cell in row-major order.
+    rows = len(lastColumn) - 1
+    candidates = np.concatenate((lastColumn[:-1], lastRow))
+    index = int(np.argmin(candidates))
+    end = (index, len(lastRow) - 1) if index < rows else (rows, index - rows)
+    return candidates[index].item(), end
+
+
+def alignmentEnd(costs, rowCol, mode, band=-1):
+    # Cost and position of the cell the traceback starts from, in a full matrix
+    # or a band strip
+    rows, cols = rowCol
+
+    def cells(rowIndices, colIndices):
+        if band < 0:
+            return costs[rowIndices, colIndices]
+        stripCols = colIndices - rowIndices + band
+        inside = (stripCols >= 0) & (stripCols < costs.shape[1])
+        values = np.full(len(rowIndices), unreachableCost(costs.dtype), dtype=costs.dtype)
+        values[inside] = costs[rowIndices[inside], stripCols[inside]]
+        return values
+
+    if mode == 'local':
+        row, stripCol = (int(index) for index in np.unravel_index(np.argmin(costs), costs.shape))
+        return costs[row, stripCol].item(), (row, stripCol + row - band if band >= 0 else stripCol)
+    if mode == 'semiglobal':
+        return semiGlobalEnd(cells(np.full(cols + 1, rows), np.arange(cols + 1)),
+                             cells(np.arange(rows + 1), np.full(rows + 1, cols)))
+    return cells(np.array([rows]), np.array([cols]))[0].item(), rowCol
+
+
+class EditScript:
+    # Traceback sink that takes the place of a path list. Steps arrive
+    # backwards, one per column, and are folded into runs of CIGAR operations
+    # on arrival, so a long alignment is held as a few runs, not a tuple per column.
+    OPERATIONS = {UP: 'D', LEFT: 'I'}
+
+    def __init__(self):
+        self.runs = []
+
+    def append(self, step):
+        direction, isMatch, _ = step
+        operation = ('=' if isMatch else 'X') if direction == DIAGONAL else self.OPERATIONS[direction]
+        if self.runs and self.runs[-1][0] == operation:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([operation, 1])
+
+    def cigar(self):
+        return ''.join(f'{length}{operation}' for operation, length in reversed(self.runs))
+
+    def region(self, end):
+        # (seq1Start, seq1End, seq2Start, seq2End), half-open
+        used1 = sum(length for operation, length in self.runs if operation != 'I')
+        used2 = sum(length for operation, length in self.runs if operation != 'D')
+        return end[0] - used1, end[0], end[1] - used2, end[1]
+
+
+def aligned_chunks(seq1: str | bytes, seq2: str | bytes, cigar: str, region=None, gap='-', chunk_size=4096):
+    """
+        Expand an edit script into the aligned strings, chunk_size columns at a time,
+        so a long alignment can be written out without ever holding it whole.
+        :param seq1: the first aligned sequence
+        :param seq2: the second aligned sequence
+        :param cigar: the edit script, as in AlignmentResult.cigar
+        :param region: where the script starts, as in AlignmentResult.region; defaults to both starts
+        :param gap: the character to use to represent gaps
+        :param chunk_size: columns per chunk
+        :return: a generator of (aligned1, aligned2) string pairs
+    """
+    seq1, seq2 = matchSequenceTypes(seq1, seq2)
+    decode = (lambda residues: residues) if isinstance(seq1, str) else (lambda residues: bytes(residues).decode('latin-1'))
+    row, col = (region[0], region[2]) if region else (0, 0)
+    pending1 = []
+    pending2 = []
+    pendingLength = 0
+
+    for match in re.finditer(r'(\d+)([=XID])', cigar):
+        remaining = int(match.group(1))
+        operation = match.group(2)
+        while remaining:
+            length = min(remaining, chunk_size - pendingLength)
+            if operation == 'I':
+                pending1.append(gap * length)
+            else:
+                pending1.append(decode(seq1[row:row + length]))
+                row += length
+            if operation == 'D':
+                pending2.append(gap * length)
+            else:
+                pending2.append(decode(seq2[col:col + length]))
+                col += length
+
+            remaining -= length
+            pendingLength += length
+            if pendingLength == chunk_size:
+                yield ''.join(pending1), ''.join(pending2)
+                pending1, pending2, pendingLength = [], [], 0
+
+    if pendingLength:
+        yield ''.join(pending1), ''.join(pending2)
+
+
+def write_alignment(file, seq1: str | bytes, seq2: str | bytes, result: AlignmentResult, gap='-', width=60):
+    """
+        Stream an alignment to a text file or buffer in blocks of width columns:
+        a line of seq1, a line of seq2 and a blank line per block.
+        Works from the result's edit script, so align can be called with output="cigar".
+    """
+    for aligned1, aligned2 in aligned_chunks(seq1, seq2, result.cigar, result.region, gap, width):
+        file.write(f'{aligned1}\n{aligned2}\n\n')
+
+
+def encodeSequence(seq):
+    if isinstance(seq, str):
+        return np.frombuffer(seq.encode('utf-32-le'), dtype=np.uint32)
+    return np.frombuffer(seq, dtype=np.uint8)
+
+
+def matchSequenceTypes(seq1, seq2):
+    # Buffers index to ints and str to characters; a str paired with a buffer
+    # is encoded so residues compare equal
+    if isinstance(seq1, str) != isinstance(seq2, str):
+        return tuple(seq.encode('latin-1') if isinstance(seq, str) else seq for seq in (seq1, seq2))
+    return seq1, seq2
+
+
+def scanRow(previousRow, firstCost, substitution, indel_penalty):
+    # One row of the linear-gap recurrence as vector operations. The left
+    # neighbour chain is a running minimum: cell j is the best over k <= j of
+    # fromAbove[k] + (j - k) * indel_penalty, found with a cumulative minimum.
+    steps = indel_penalty * np.arange(len(previousRow), dtype=previousRow.dtype)
+    diagonalCellCost = previousRow[:-1] + substitution
+    topCellCost = previousRow[1:] + indel_penalty
+
+    currentRow = np.empty_like(previousRow)
+    currentRow[0] = firstCost
+    np.minimum(diagonalCellCost, topCellCost, out=currentRow[1:])
+    currentRow -= steps
+    np.minimum.accumulate(currentRow, out=currentRow)
+    currentRow += steps
 
-        if currentCell.getDirection() == "up":
+    leftCellCost = currentRow[:-1] + indel_penalty
+    directions = np.full(len(currentRow), UP, dtype=np.uint8)
+    directions[1:][leftCellCost == currentRow[1:]] = LEFT
+    directions[1:][diagonalCellCost == currentRow[1:]] = DIAGONAL
+    return currentRow, directions
+
+
+def scanColumn(previousColumn, firstCost, substitution, indel_penalty):
+    # scanRow turned on its side, for a matrix filled a column at a time: the
+    # running minimum runs down the column (up steps), and ties still go to
+    # the diagonal, then left (from previousColumn), then up.
+    steps = indel_penalty * np.arange(len(previousColumn), dtype=previousColumn.dtype)
+    diagonalCellCost = previousColumn[:-1] + substitution
+    leftCellCost = previousColumn + indel_penalty
+
+    currentColumn = np.empty_like(previousColumn)
+    currentColumn[0] = firstCost
+    np.minimum(diagonalCellCost, leftCellCost[1:], out=currentColumn[1:])
+    currentColumn -= steps
+    np.minimum.accumulate(currentColumn, out=currentColumn)
+    currentColumn += steps
+
+    directions = np.full(len(currentColumn), UP, dtype=np.uint8)
+    directions[leftCellCost == currentColumn] = LEFT
+    directions[1:][diagonalCellCost == currentColumn[1:]] = DIAGONAL
+    return currentColumn, directions
+
+
+def buildLinearSpaceLoop(path, codes1, codes2, costType, indel_penalty, table):
+    # Divide and conquer in the spirit of Hirschberg, but exact: instead of
+    # any optimal split we follow where the full engine's own traceback
+    # leaves the middle row, so the path (ties included) is identical.
+    leafCells = max(len(codes1), len(codes2), 1024)
+    cells = 0
+    cost = 0
+
+    def solve(topRow, leftCol, bottomRow, rightCol):
+        nonlocal cells, cost
+        rows = bottomRow - topRow
+        cols = rightCol - leftCol
+        cells += rows * cols
+        if rows <= 1 or cols <= 1 or (rows + 1) * (cols + 1) <= leafCells:
+            sub1 = codes1[topRow:bottomRow]
+            sub2 = codes2[leftCol:rightCol]
+            directions = PackedTraceback(sub1, sub2)
+            leafCost, _ = calculateCostsWavefront(sub1, sub2, directions, costType, indel_penalty, table)
+            cost += leafCost
+            for direction, isMatch, (row, col) in buildLoop([], directions, (rows, cols)):
+                path.append((direction, isMatch, (row + topRow, col + leftCol)))
+            return
+
+        middleRow = topRow + rows // 2
+        crossing = leftCol + findCrossing(codes1[topRow:bottomRow], codes2[leftCol:rightCol], rows // 2)
+
+        # path is built backwards, so the bottom half goes first
+        solve(middleRow, crossing, bottomRow, rightCol)
+        solve(topRow, leftCol, middleRow, crossing)
+
+    def findCrossing(subCodes1, subCodes2, middleRow):
+        # Column where the traceback from the bottom-right corner leaves
+        # middleRow. Below the middle row each cell carries the middle-row
+        # column its traceback would reach.
+        cols = len(subCodes2)
+        profile = table[:, subCodes2]
+        positions = np.arange(cols + 1)
+        previousRow = (indel_penalty * positions).astype(costType)
+        exits = positions.copy()
+
+        for row in range(1, len(subCodes1) + 1):
+            previousRow, directions = scanRow(previousRow, row * indel_penalty, profile[subCodes1[row - 1]],
+                                              indel_penalty)
+            if row <= middleRow:
+                continue
+
+            fromAbove = exits.copy()
+            diagonal = directions[1:] == DIAGONAL
+            fromAbove[1:][diagonal] = exits[:-1][diagonal]
+            # a left step inherits from the nearest cell to its left that is not a left step
+            source = np.where(directions != LEFT, positions, 0)
+            np.maximum.accumulate(source, out=source)
+            exits = fromAbove[source]
+
+        return int(exits[cols])
+
+    solve(0, 0, len(codes1), len(codes2))
+    return path, cells, cost
+
+
+def kmerHashes(codes, kmerSize):
+    # Polynomial hash of every k-mer, wrapping modulo 2**64
+    count = max(len(codes) - kmerSize + 1, 0)
+    hashes = np.zeros(count, dtype=np.uint64)
+    codes = codes.astype(np.uint64)
+    for offset in range(kmerSize):
+        hashes = hashes * np.uint64(1000003) + codes[offset:offset + count]
+    return hashes
+
+
+def findSeeds(codes1, codes2, kmerSize, maxOccurrences):
+    # (row, col) start of every k-mer of seq1 that also occurs in seq2
+    hashes2 = kmerHashes(codes2, kmerSize)
+    index = np.argsort(hashes2, kind='stable')
+    sortedHashes = hashes2[index]
+    hashes1 = kmerHashes(codes1, kmerSize)
+    first = np.searchsorted(sortedHashes, hashes1, 'left')
+    counts = np.searchsorted(sortedHashes, hashes1, 'right') - first
+
+    seeded = (counts > 0) & (counts <= maxOccurrences)
+    counts = counts[seeded]
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(np.nonzero(seeded)[0], counts), index[np.repeat(first[seeded], counts) + offsets]
+
+
+def chainSeeds(rows, cols):
+    # Longest chain of seeds increasing in both row and column (a longest
+    # increasing subsequence of columns once seeds are sorted by row; equal
+    # rows are sorted by descending column so only one of them can be used)
+    order = np.lexsort((-cols, rows))
+    tails = []
+    tailSeeds = []
+    previous = [-1] * len(order)
+    for seed, col in enumerate(cols[order].tolist()):
+        length = bisect_left(tails, col)
+        if length == len(tails):
+            tails.append(col)
+            tailSeeds.append(seed)
+        else:
+            tails[length] = col
+            tailSeeds[length] = seed
+        previous[seed] = tailSeeds[length - 1] if length else -1
+
+    chain = []
+    seed = tailSeeds[-1] if tailSeeds else -1
+    while seed >= 0:
+        chain.append(order[seed])
+        seed = previous[seed]
+    return np.array(chain[::-1], dtype=np.intp)
+
+
+class ScoreRows:
+    # Row geometry shared by the score-only kernels. Rows are float64 so that
+    # unreachable cells can hold inf. Full rows cover columns 0..m; banded rows
+    # cover the 2k+1 strip of calculateBandedCosts. The query profile holds one
+    # column per residue of codes2 (column 0 of a full row has no diagonal step
+    # and costs 0); a banded row gathers its strip from it, clipped at the
+    # matrix edges, so strip cells outside the matrix cost 0 and are masked as
+    # outside anyway.
+    def __init__(self, codes2, band, table):
+        self.band = band
+        self.cols = len(codes2)
+        self.width = 2 * band + 1 if band >= 0 else self.cols + 1
+        firstCol = 0 if band >= 0 else 1
+        self.profile = np.zeros((len(table), firstCol + self.cols))
+        self.profile[:, firstCol:] = table[:, codes2.astype(np.intp)]
+        self.positions = np.arange(self.width)
+
+    def columns(self, row):
+        if self.band >= 0:
+            return self.positions + row - self.band
+        return self.positions
+
+    def substitution(self, row, residue):
+        # Diagonal cost into every cell of the row, gathered from the query profile
+        if self.band < 0:
+            return self.profile[residue]
+        first = row - self.band
+        start, end = max(first, 1), min(row + self.band, self.cols)
+        strip = np.zeros(self.width)
+        if start <= end:
+            strip[start - first:end - first + 1] = self.profile[residue, start - 1:end]
+        return strip
+
+    def outside(self, row):
+        columns = self.columns(row)
+        return (columns < 0) | (columns > self.cols)
+
+    def neighbours(self, previousRow):
+        # (diagonal, top) neighbour of every cell, taken from the row above
+        if self.band >= 0:
+            return previousRow, np.append(previousRow[1:], math.inf)
+        return np.insert(previousRow[:-1], 0, math.inf), previousRow
+
+    def last(self, row):
+        return self.cols - row + self.band if self.band >= 0 else self.cols
+
+    def lastColumn(self, currentRow, row):
+        # Cost of the row's cell in the last column, or inf when it is outside the band
+        last = self.last(row)
+        return currentRow[last] if 0 <= last < self.width else math.inf
+
+
+def calculateScore(codes1, codes2, band, indel_penalty, table, mode='global', ceiling=None):
+    geometry = ScoreRows(codes2, band, table)
+    steps = indel_penalty * geometry.positions.astype(np.float64)
+    edgePenalty = indel_penalty if mode == 'global' else 0
+
+    previousRow = edgePenalty * geometry.columns(0).astype(np.float64)
+    previousRow[geometry.outside(0)] = math.inf
+    # Without traceback only the best end cell's cost is needed: any cell for
+    # local, the last column or the last row for semi-global
+    best = 0 if mode == 'local' else geometry.lastColumn(previousRow, 0)
+
+    for row in range(1, len(codes1) + 1):
+        diagonal, top = geometry.neighbours(previousRow)
+        currentRow = np.minimum(diagonal + geometry.substitution(row, codes1[row - 1]), top + indel_penalty)
+        if mode == 'local':
+            np.minimum(currentRow, 0, out=currentRow)
+        elif mode == 'semiglobal':
+            currentRow[geometry.columns(row) == 0] = 0
+        outside = geometry.outside(row)
+        currentRow[outside] = math.inf
+
+        currentRow -= steps
+        np.minimum.accumulate(currentRow, out=currentRow)
+        currentRow += steps
+        currentRow[outside] = math.inf
+        previousRow = currentRow
+        if ceiling and ceiling.exceeded(ceiling.lowest(currentRow, row, geometry.columns(row))):
+            return math.inf
+
+        if mode == 'local':
+            best = min(best, currentRow.min())
+        elif mode == 'semiglobal':
+            best = min(best, geometry.lastColumn(currentRow, row))
+
+    if mode == 'local':
+        return best
+    if mode == 'semiglobal':
+        return min(best, previousRow.min())
+    return previousRow[geometry.last(len(codes1))]
+
+
+def calculateAffineScore(codes1, codes2, band, indel_penalty, table, gap_open_penalty):
+    geometry = ScoreRows(codes2, band, table)
+    steps = indel_penalty * geometry.positions.astype(np.float64)
+    openCost = gap_open_penalty + indel_penalty
+
+    columns = geometry.columns(0)
+    previousMatch = np.where(columns == 0, 0.0, math.inf)
+    previousDelete = np.full(geometry.width, math.inf)
+    previousInsert = np.where(columns > 0, gap_open_penalty + indel_penalty * columns, math.inf)
+    previousInsert[geometry.outside(0)] = math.inf
+    previousBest = np.minimum(previousMatch, previousInsert)
+
+    for row in range(1, len(codes1) + 1):
+        diagonal, top = geometry.neighbours(previousBest)
+        _, topDelete = geometry.neighbours(previousDelete)
+        outside = geometry.outside(row)
+
+        currentMatch = diagonal + geometry.substitution(row, codes1[row - 1])
+        currentDelete = np.minimum(top + openCost, topDelete + indel_penalty)
+        currentMatch[outside] = math.inf
+        currentDelete[outside] = math.inf
+
+        # An insert run at cell j opens after some cell k < j of the same row
+        # that does not itself end in an insert
+        opened = np.minimum(currentMatch, currentDelete) - steps
+        np.minimum.accumulate(opened, out=opened)
+        currentInsert = np.empty(geometry.width)
+        currentInsert[0] = math.inf
+        currentInsert[1:] = opened[:-1] + gap_open_penalty + steps[1:]
+        currentInsert[outside] = math.inf
+
+        previousDelete = currentDelete
+        previousBest = np.minimum(np.minimum(currentMatch, currentDelete), currentInsert)
+
+    return previousBest[geometry.last(len(codes1))]
+
+
+def calculateCostsTiled(codes1, codes2, costType, indel_penalty, table, workers, checkpointDir=None):
+    # Tiles on one block anti-diagonal are independent: each needs only the
+    # row above it and the column to its left. Those boundaries, and the
+    # traceback matrix the tiles write into, live in shared memory, or in
+    # memory-mapped files under checkpointDir when the run is checkpointed.
+    rows = len(codes1)
+    cols = len(codes2)
+    maxTileSize = CHECKPOINT_TILE_SIZE if checkpointDir is not None else None
+    rowEdges = tileEdges(rows, workers, maxTileSize)
+    colEdges = tileEdges(cols, workers, maxTileSize)
+    layout = (
+        ((rows + 1, cols + 1), np.uint8),
+        ((len(rowEdges), cols + 1), costType),
+        ((len(colEdges), rows + 1), costType),
+    )
+
+    tiles = [[] for _ in range(len(rowEdges) + len(colEdges) - 3)]
+    for tileRow in range(len(rowEdges) - 1):
+        for tileCol in range(len(colEdges) - 1):
+            rowSpan = (tileRow, rowEdges[tileRow], rowEdges[tileRow + 1])
+            colSpan = (tileCol, colEdges[tileCol], colEdges[tileCol + 1])
+            tileCodes2 = codes2[colSpan[1]:colSpan[2]]
+            tiles[tileRow + tileCol].append((rowSpan, colSpan, codes1[rowSpan[1]:rowSpan[2]], tileCodes2,
+                                             table[:, tileCodes2], indel_penalty))
+
+    if checkpointDir is not None:
+        key = checkpointKey(codes1, codes2, costType, indel_penalty, table, rowEdges, colEdges)
+        return calculateCostsCheckpointed(Path(checkpointDir), key, layout, tiles, workers, indel_penalty,
+                                          rowEdges, colEdges)
+
+    memories = [SharedMemory(create=True, size=max(1, math.prod(shape) * np.dtype(dtype).itemsize))
+                for shape, dtype in layout]
+    shared = tuple((memory.name, shape, dtype) for memory, (shape, dtype) in zip(memories, layout))
+
+    try:
+        directions, rowBoundaries, colBoundaries = (
+            np.ndarray(shape, dtype=dtype, buffer=memory.buf) for memory, (shape, dtype) in zip(memories, layout))
+        initializeTiles(directions, rowBoundaries, colBoundaries, indel_penalty, rowEdges, colEdges)
+        fillTiles((directions, rowBoundaries, colBoundaries), shared, computeSharedTile, tiles, workers)
+
+        finalCost = rowBoundaries[-1, -1].item()
+        path = buildLoop(EditScript(), directions, (rows, cols))
+        del directions, rowBoundaries, colBoundaries
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+    return finalCost, path
+
+
+def calculateCostsCheckpointed(directory, key, layout, tiles, workers, indel_penalty, rowEdges, colEdges):
+    # The matrices are memory-mapped files, so they may exceed RAM. After a
+    # block anti-diagonal finishes, and at most every CHECKPOINT_SECONDS, the
+    # files are flushed and progress.json records how many anti-diagonals are
+    # done; a later run over the same inputs picks up after them.
+    directory.mkdir(parents=True, exist_ok=True)
+    progressPath = directory / CHECKPOINT_PROGRESS
+    completed = readCheckpoint(progressPath, key)
+    mapped = tuple((str(directory / name), shape, dtype) for name, (shape, dtype) in zip(CHECKPOINT_FILES, layout))
+    arrays = [np.memmap(path, dtype=dtype, mode='r+' if completed else 'w+', shape=shape)
+              for path, shape, dtype in mapped]
+    if not completed:
+        initializeTiles(*arrays, indel_penalty, rowEdges, colEdges)
+
+    lastCheckpoint = perf_counter()
+
+    def checkpoint(done):
+        nonlocal lastCheckpoint
+        if done < len(tiles) and perf_counter() - lastCheckpoint < CHECKPOINT_SECONDS:
+            return
+        for array in arrays:
+            array.flush()
+        writeCheckpoint(progressPath, key, done)
+        lastCheckpoint = perf_counter()
+
+    fillTiles(arrays, mapped, computeMappedTile, tiles, workers, completed, checkpoint)
+
+    directions, rowBoundaries, _ = arrays
+    finalCost = rowBoundaries[-1, -1].item()
+    path = buildLoop(EditScript(), directions, (len(directions) - 1, directions.shape[1] - 1))
+    del arrays, directions, rowBoundaries
+    progressPath.unlink()
+    for fileName, _, _ in mapped:
+        os.unlink(fileName)
+    return finalCost, path
+
+
+def checkpointKey(codes1, codes2, costType, indel_penalty, table, rowEdges, colEdges):
+    # A checkpoint is only resumed by a run with the same inputs and tile layout
+    digest = hashlib.sha256(f'{np.dtype(costType).str}:{indel_penalty}:{rowEdges}:{colEdges}:'.encode())
+    for array in (codes1, codes2, table):
+        digest.update(f'{array.dtype.str}{array.shape}'.encode())
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def readCheckpoint(progressPath, key):
+    # The number of block anti-diagonals already filled; 0 starts over
+    try:
+        with open(progressPath) as file:
+            progress = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return 0
+    return progress['completed'] if progress.get('key') == key else 0
+
+
+def writeCheckpoint(progressPath, key, completed):
+    handle, temporary = tempfile.mkstemp(dir=progressPath.parent, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as file:
+            json.dump({'key': key, 'completed': completed}, file)
+        os.replace(temporary, progressPath)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def initializeTiles(directions, rowBoundaries, colBoundaries, indel_penalty, rowEdges, colEdges):
+    directions[0] = LEFT
+    directions[:, 0] = UP
+    directions[0, 0] = STOP
+    rowBoundaries[0] = indel_penalty * np.arange(rowBoundaries.shape[1])
+    colBoundaries[0] = indel_penalty * np.arange(colBoundaries.shape[1])
+    rowBoundaries[:, 0] = indel_penalty * np.array(rowEdges)
+    colBoundaries[:, 0] = indel_penalty * np.array(colEdges)
+
+
+def fillTiles(arrays, storage, tileWorker, tiles, workers, completed=0, checkpoint=None):
+    # Fill the block anti-diagonals after the first completed ones, calling
+    # checkpoint with the running count after each
+    remaining = enumerate(tiles[completed:], completed + 1)
+    if workers == 1:
+        for done, antiDiagonal in remaining:
+            for tile in antiDiagonal:
+                computeTile(*arrays, *tile)
+            if checkpoint:
+                checkpoint(done)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for done, antiDiagonal in remaining:
+                list(executor.map(tileWorker, [storage] * len(antiDiagonal), antiDiagonal))
+                if checkpoint:
+                    checkpoint(done)
+
+
+def tileEdges(length, workers, maxTileSize=None):
+    # About four tiles per worker along each side keeps the block
+    # anti-diagonals wide enough to occupy every worker
+    tileSize = max(256, -(-length // (4 * workers)))
+    if maxTileSize:
+        tileSize = min(tileSize, maxTileSize)
+    return list(range(0, length, tileSize)) + [length] if length else [0, 0]
+
+
+def computeSharedTile(shared, tile):
+    # Pool workers share the parent's resource tracker, so attaching here does
+    # not hand ownership away; the parent unlinks the blocks when it is done
+    memories = [SharedMemory(name=name) for name, _, _ in shared]
+    try:
+        arrays = [np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+                  for memory, (_, shape, dtype) in zip(memories, shared)]
+        computeTile(*arrays, *tile)
+        del arrays
+    finally:
+        for memory in memories:
+            memory.close()
+
+
+def computeMappedTile(mapped, tile):
+    arrays = [np.memmap(path, dtype=dtype, mode='r+', shape=shape) for path, shape, dtype in mapped]
+    computeTile(*arrays, *tile)
+    for array in arrays:
+        array.flush()
+
+
+def computeTile(directions, rowBoundaries, colBoundaries, rowSpan, colSpan, codes1, codes2, profile, indel_penalty):
+    tileRow, firstRow, lastRow = rowSpan
+    tileCol, firstCol, lastCol = colSpan
+
+    previousRow = rowBoundaries[tileRow, firstCol:lastCol + 1].copy()
+    for row in range(firstRow + 1, lastRow + 1):
+        residue = codes1[row - firstRow - 1]
+        currentRow, rowDirections = scanRow(previousRow, colBoundaries[tileCol, row], profile[residue],
+                                            indel_penalty)
+        matches = codes2 == residue
+        rowDirections[1:][matches & (rowDirections[1:] == DIAGONAL)] |= MATCH
+        directions[row, firstCol + 1:lastCol + 1] = rowDirections[1:]
+        colBoundaries[tileCol + 1, row] = currentRow[-1]
+        previousRow = currentRow
+
+    rowBoundaries[tileRow + 1, firstCol + 1:lastCol + 1] = previousRow[1:]
+
+
+def editDistanceScale(match_award, indel_penalty, sub_penalty):
+    # Every global alignment has n + m = 2 * diagonals + indels, so its cost is
+    # (sub_penalty - indel_penalty) * (n + m) + scale * editDistance exactly
+    # when match_award - sub_penalty == -scale with scale = 2 * indel_penalty - sub_penalty.
+    # Returns the scale, or None when the scores are not an edit distance.
+    scale = 2 * indel_penalty - sub_penalty
+    if scale > 0 and match_award - sub_penalty == -scale:
+        return scale
+    return None
+
+
+def editDistanceToCost(editDistance, pathLength, match_award, indel_penalty, sub_penalty):
+    scale = editDistanceScale(match_award, indel_penalty, sub_penalty)
+    return (sub_penalty - indel_penalty) * pathLength + scale * editDistance
+
+
+def editDistanceCeiling(maxCost, rows, cols, match_award, indel_penalty, sub_penalty):
+    # max_cost as a CostCeiling on the unit-cost matrix: the cost is increasing
+    # in the edit distance, and the rest of a path costs at least its
+    # difference in gaps, since a match costs nothing
+    scale = editDistanceScale(match_award, indel_penalty, sub_penalty)
+    maxDistance = (maxCost - (sub_penalty - indel_penalty) * (rows + cols)) / scale
+    return CostCeiling(maxDistance, range(rows), range(cols), 1, np.zeros((1, 1)))
+
+
+def calculateEditDistance(seq1, seq2, keepRows=False, ceiling=None):
+    # Myers' bit-vector algorithm (Hyyro's global formulation). seq2 is packed
+    # into Python integers used as bit vectors, and each residue of seq1 updates
+    # a whole row of the unit-cost matrix at once. positiveDeltas/negativeDeltas
+    # mark the columns where the row increases/decreases by one from the column
+    # before. With keepRows the per-row vectors are kept for the traceback.
+    # A ceiling (see editDistanceCeiling) is checked every
+    # EDIT_DISTANCE_CHECK_ROWS rows, when the row is unpacked to find its
+    # cheapest finish; (inf, None) is returned once no path can get under it.
+    cols = len(seq2)
+    allColumns = (1 << cols) - 1
+    lastColumn = 1 << (cols - 1) if cols else 0
+    matchVectors = {}
+    for col, residue in enumerate(seq2):
+        matchVectors[residue] = matchVectors.get(residue, 0) | (1 << col)
+
+    positiveDeltas = allColumns
+    negativeDeltas = 0
+    distance = cols
+    rowDeltas = [(positiveDeltas, negativeDeltas)] if keepRows else None
+
+    for row, residue in enumerate(seq1, 1):
+        matches = matchVectors.get(residue, 0)
+        verticalChange = matches | negativeDeltas
+        diagonalChange = (((matches & positiveDeltas) + positiveDeltas) ^ positiveDeltas) | matches
+        upIncreases = negativeDeltas | (~(diagonalChange | positiveDeltas) & allColumns)
+        upDecreases = positiveDeltas & diagonalChange
+        if upIncreases & lastColumn:
+            distance += 1
+        elif upDecreases & lastColumn:
+            distance -= 1
+
+        # column 0 of every row is one more than the row above
+        upIncreases = ((upIncreases << 1) | 1) & allColumns
+        upDecreases = (upDecreases << 1) & allColumns
+        positiveDeltas = upDecreases | (~(verticalChange | upIncreases) & allColumns)
+        negativeDeltas = upIncreases & verticalChange
+        if keepRows:
+            rowDeltas.append((positiveDeltas, negativeDeltas))
+        if ceiling and cols and row % EDIT_DISTANCE_CHECK_ROWS == 0:
+            distances = deltaDistances(row, positiveDeltas, negativeDeltas, cols)
+            if ceiling.exceeded(ceiling.lowest(distances, row, np.arange(cols + 1)), row * cols):
+                return math.inf, None
+
+    if not cols:
+        distance = len(seq1)
+    return distance, rowDeltas
+
+
+def editDistanceRow(row, rowDeltas, cols):
+    # Unpack one row of the unit-cost matrix from its delta bit vectors
+    return deltaDistances(row, *rowDeltas[row], cols)
+
+
+def deltaDistances(row, positiveDeltas, negativeDeltas, cols):
+    byteCount = (cols + 7) // 8
+    positiveDeltas, negativeDeltas = (
+        np.unpackbits(np.frombuffer(deltas.to_bytes(byteCount, 'little'), dtype=np.uint8),
+                      bitorder='little')[:cols].astype(np.int64)
+        for deltas in (positiveDeltas, negativeDeltas))
+    distances = np.empty(cols + 1, dtype=np.int64)
+    distances[0] = row
+    np.cumsum(positiveDeltas - negativeDeltas, out=distances[1:])
+    distances[1:] += row
+    return distances
+
+
+def buildEditDistanceLoop(path, seq1, seq2, rowDeltas):
+    # Same walk as buildLoop, deciding each step from the unit-cost distances:
+    # the scores are an affine function of them, so the tight predecessors,
+    # and therefore the tie-breaking, are the same
+    row = len(seq1)
+    col = len(seq2)
+    currentRow = editDistanceRow(row, rowDeltas, col)
+    rowAbove = editDistanceRow(row - 1, rowDeltas, col) if row else None
+
+    while row or col:
+        if row and col:
+            isMatch = seq1[row - 1] == seq2[col - 1]
+            if rowAbove[col - 1] + (0 if isMatch else 1) == currentRow[col]:
+                direction = DIAGONAL
+            elif currentRow[col - 1] + 1 == currentRow[col]:
+                direction = LEFT
+            else:
+                direction = UP
+        else:
+            isMatch = False
+            direction = LEFT if col else UP
+
+        path.append((direction, direction == DIAGONAL and isMatch, (row, col)))
+        if direction != LEFT:
             row -= 1
-        elif currentCell.getDirection() == "left":
+            currentRow = rowAbove
+            rowAbove = editDistanceRow(row - 1, rowDeltas, len(seq2)) if row else None
+        if direction != UP:
             col -= 1
-        elif currentCell.getDirection() == "diagonal":
+
+    return path
+
+
+def fourRussiansWeight(match_award, indel_penalty, sub_penalty):
+    # As in editDistanceScale, n + m = 2 * diagonals + indels makes the cost of
+    # a global alignment (match_award * (n + m) + gapWeight * distance) / 2 for
+    # gapWeight = 2 * indel_penalty - match_award, where distance weighs each
+    # gap 1 and each substitution 2 * (sub_penalty - match_award) / gapWeight.
+    # The block tables need neighbouring distances to differ by at most 1, which
+    # holds for substitution weights 0, 1 and 2; a heavier substitution always
+    # loses to two gaps, so it weighs 2 as well.
+    # Returns (substitutionWeight, gapWeight), or None for any other weights.
+    gapWeight = 2 * indel_penalty - match_award
+    substitutionCost = 2 * (sub_penalty - match_award)
+    if gapWeight <= 0 or substitutionCost < 0:
+        return None
+    if substitutionCost >= 2 * gapWeight:
+        return 2, gapWeight
+    if substitutionCost in (0, gapWeight):
+        return int(substitutionCost // gapWeight), gapWeight
+    return None
+
+
+def encodeEdges(changes):
+    # Base-3 code of the distance changes (-1, 0 or +1) along block edges, one edge per row
+    return ((changes + 1) * 3 ** np.arange(changes.shape[1])).sum(axis=1)
+
+
+def decodeEdges(codes):
+    return codes[:, None] // 3 ** np.arange(FOUR_RUSSIANS_BLOCK) % 3 - 1
+
+
+def fourRussiansTables(substitutionWeight):
+    # The bottom and right edges of a block for every input it can have: the
+    # codes of its top and left edges and a bit for each of its residue pairs
+    # that match, bit row * FOUR_RUSSIANS_BLOCK + col for seq1's row and seq2's
+    # col. All inputs are solved at once, a cell at a time across them. Inputs
+    # are numbered (top * edges + left) * patterns + matches, and the tables
+    # hold edge codes already multiplied out to their place in that number.
+    if substitutionWeight in FOUR_RUSSIANS_TABLES:
+        return FOUR_RUSSIANS_TABLES[substitutionWeight]
+    size = FOUR_RUSSIANS_BLOCK
+    edges = 3 ** size
+    patterns = 1 << (size * size)
+    inputs = np.arange(edges * edges * patterns)
+    matches = ((inputs % patterns)[:, None] >> np.arange(size * size)) & 1
+    firstColumn = np.cumsum(decodeEdges(inputs // patterns % edges), axis=1)
+
+    # Distances relative to the block's top-left corner
+    previousRow = np.zeros((len(inputs), size + 1), dtype=np.int8)
+    np.cumsum(decodeEdges(inputs // (edges * patterns)), axis=1, out=previousRow[:, 1:])
+    right = np.empty((len(inputs), size), dtype=np.int8)
+    for row in range(size):
+        currentRow = np.empty_like(previousRow)
+        currentRow[:, 0] = firstColumn[:, row]
+        for col in range(1, size + 1):
+            diagonalCellCost = previousRow[:, col - 1] + np.where(matches[:, row * size + col - 1], 0,
+                                                                   substitutionWeight)
+            currentRow[:, col] = np.minimum(np.minimum(diagonalCellCost, previousRow[:, col] + 1),
+                                            currentRow[:, col - 1] + 1)
+        right[:, row] = currentRow[:, size] - previousRow[:, size]
+        previousRow = currentRow
+
+    tables = encodeEdges(np.diff(previousRow, axis=1)) * edges * patterns, encodeEdges(right) * patterns
+    FOUR_RUSSIANS_TABLES[substitutionWeight] = tables
+    return tables
+
+
+def blockPatterns(blocks1, blocks2, alphabetSize):
+    # Match patterns of blocks as fourRussiansTables numbers them. Over a small
+    # alphabet each block becomes a word, and patterns[words1[i] + words2[j]]
+    # is the pattern of blocks1[i] against blocks2[j]. Returns None for larger
+    # alphabets, whose patterns are found by comparing the blocks instead.
+    size = FOUR_RUSSIANS_BLOCK
+    wordCount = alphabetSize ** size
+    if wordCount > 1 << (size * size):
+        return None
+    powers = alphabetSize ** np.arange(size)
+    residues = np.arange(wordCount)[:, None] // powers % alphabetSize
+    bits = (1 << np.arange(size * size)).reshape(size, size)
+    patterns = ((residues[:, None, :, None] == residues[None, :, None, :]) * bits).sum(axis=(2, 3))
+    return blocks1.astype(np.intp) @ powers * wordCount, blocks2.astype(np.intp) @ powers, patterns.ravel()
+
+
+def calculateFourRussians(codes1, codes2, alphabetSize, substitutionWeight):
+    # The weighted edit distance of fourRussiansWeight by the Four-Russians
+    # method: the matrix is cut into blocks of FOUR_RUSSIANS_BLOCK residues a
+    # side, and each block's bottom and right edges are looked up from its top
+    # and left edges and its match pattern instead of computed cell by cell.
+    # Edges are kept as the changes of distance along them, which take few
+    # enough values to tabulate. A block waits only on the blocks above it and
+    # to its left, so each anti-diagonal of blocks is one round of lookups;
+    # seq2's blocks are kept in reverse, which makes every anti-diagonal the
+    # same run of indices on both sides. Rows and columns past the last whole
+    # block are finished with scanColumn and scanRow.
+    size = FOUR_RUSSIANS_BLOCK
+    bottomTable, rightTable = fourRussiansTables(substitutionWeight)
+    edges = 3 ** size
+    patterns = 1 << (size * size)
+    blockRows, blockCols = len(codes1) // size, len(codes2) // size
+    blocks1 = codes1[:blockRows * size].reshape(blockRows, size)
+    blocks2 = codes2[:blockCols * size].reshape(blockCols, size)[::-1]
+    words = blockPatterns(blocks1, blocks2, alphabetSize)
+    bits = (1 << np.arange(size * size)).reshape(size, size)
+
+    # Gaps weigh 1, so along row 0 and down column 0 the distance rises by 1 a step
+    horizontal = np.full(blockCols, (edges - 1) * edges * patterns, dtype=np.intp)
+    vertical = np.full(blockRows, (edges - 1) * patterns, dtype=np.intp)
+    for diagonal in range(blockRows + blockCols - 1):
+        first, last = max(0, diagonal - blockCols + 1), min(blockRows, diagonal + 1)
+        offset = blockCols - 1 - diagonal
+        if words is None:
+            inputs = ((blocks1[first:last, :, None] == blocks2[first + offset:last + offset, None, :])
+                      * bits).sum(axis=(1, 2))
+        else:
+            words1, words2, wordPatterns = words
+            inputs = wordPatterns[words1[first:last] + words2[first + offset:last + offset]]
+        top = horizontal[first + offset:last + offset]
+        left = vertical[first:last]
+        inputs += top
+        inputs += left
+        np.take(bottomTable, inputs, out=top)
+        np.take(rightTable, inputs, out=left)
+
+    lastRow = np.cumsum(np.concatenate(([blockRows * size],
+                                        decodeEdges(horizontal[::-1] // (edges * patterns)).ravel())))
+    lastColumn = np.cumsum(np.concatenate(([blockCols * size], decodeEdges(vertical // patterns).ravel())))
+    rowEnd = []
+    for col in range(blockCols * size + 1, len(codes2) + 1):
+        substitution = np.where(codes1[:blockRows * size] == codes2[col - 1], 0, substitutionWeight)
+        lastColumn, _ = scanColumn(lastColumn, col, substitution, 1)
+        rowEnd.append(lastColumn[-1])
+    lastRow = np.concatenate((lastRow, np.array(rowEnd, dtype=lastRow.dtype)))
+    for row in range(blockRows * size + 1, len(codes1) + 1):
+        lastRow, _ = scanRow(lastRow, row, np.where(codes2 == codes1[row - 1], 0, substitutionWeight), 1)
+    return int(lastRow[-1])
+
+
+def calculateAffineCosts(codes1, codes2, band, traceback, indel_penalty, profile, gap_open_penalty):
+    # Gotoh's recurrence: a gap of length L costs gap_open_penalty + L * indel_penalty.
+    # Only the previous row of each layer is kept; the traceback holds the rest.
+    # With band >= 0 the traceback is a strip as in calculateBandedCosts.
+    rows = len(codes1)
+    cols = len(codes2)
+    codes2 = codes2.tolist()
+    width = traceback.shape[1]
+    shift = 1 if band >= 0 else 0
+    openCost = gap_open_penalty + indel_penalty
+
+    def columnRange(row):
+        if band >= 0:
+            return range(max(0, row - band), min(cols, row + band) + 1)
+        return range(cols + 1)
+
+    def stripColumn(row, col):
+        return col - row + band if band >= 0 else col
+
+    previousMatch = [math.inf] * width
+    previousInsert = [math.inf] * width
+    previousDelete = [math.inf] * width
+    firstRow = bytearray(width)
+    for col in columnRange(0):
+        if col == 0:
+            previousMatch[stripColumn(0, col)] = 0
+        else:
+            previousInsert[stripColumn(0, col)] = gap_open_penalty + col * indel_penalty
+            firstRow[stripColumn(0, col)] = (LEFT if col > 1 else DIAGONAL) << INSERT_SHIFT
+    traceback[0] = np.frombuffer(firstRow, dtype=np.uint8)
+
+    for row in range(1, rows + 1):
+        residue = int(codes1[row - 1])
+        columns = columnRange(row)
+        substitution = rowSubstitution(profile, residue, columns.start, columns.stop - 1)
+        currentMatch = [math.inf] * width
+        currentInsert = [math.inf] * width
+        currentDelete = [math.inf] * width
+        currentCodes = bytearray(width)
+
+        for col in columns:
+            stripCol = stripColumn(row, col)
+            top = stripCol + shift
+            if col == 0:
+                currentDelete[stripCol] = gap_open_penalty + row * indel_penalty
+                currentCodes[stripCol] = (UP if row > 1 else DIAGONAL) << DELETE_SHIFT
+                continue
+
+            diagonal = top - 1
+            matchCost, matchSource = sortCosts(previousDelete[diagonal], previousInsert[diagonal],
+                                               previousMatch[diagonal])
+            currentMatch[stripCol] = matchCost + substitution[col - columns.start]
+            code = matchSource | AFFINE_MATCH if residue == codes2[col - 1] else matchSource
+
+            if stripCol > 0:
+                left = stripCol - 1
+                currentInsert[stripCol], insertSource = sortCosts(currentDelete[left] + openCost,
+                                                                  currentInsert[left] + indel_penalty,
+                                                                  currentMatch[left] + openCost)
+                code |= insertSource << INSERT_SHIFT
+
+            if top < width:
+                currentDelete[stripCol], deleteSource = sortCosts(previousDelete[top] + indel_penalty,
+                                                                  previousInsert[top] + openCost,
+                                                                  previousMatch[top] + openCost)
+                code |= deleteSource << DELETE_SHIFT
+
+            currentCodes[stripCol] = code
+
+        traceback[row] = np.frombuffer(currentCodes, dtype=np.uint8)
+        previousMatch, previousInsert, previousDelete = currentMatch, currentInsert, currentDelete
+
+    last = stripColumn(rows, cols)
+    return sortCosts(previousDelete[last], previousInsert[last], previousMatch[last])
+
+
+def buildAffineLoop(path, traceback, rowCol, layer, band=-1):
+    row = rowCol[0]
+    col = rowCol[1]
+
+    while row or col:
+        code = int(traceback[row, col - row + band if band >= 0 else col])
+        path.append((layer, layer == DIAGONAL and bool(code & AFFINE_MATCH), (row, col)))
+
+        if layer == DIAGONAL:
+            layer = code & DIRECTION_MASK
             row -= 1
             col -= 1
+        elif layer == LEFT:
+            layer = (code >> INSERT_SHIFT) & DIRECTION_MASK
+            col -= 1
         else:
-            row = 0
-            col = 0
+            layer = (code >> DELETE_SHIFT) & DIRECTION_MASK
+            row -= 1
 
     return path
 
 
-def sortCosts(costs):
-    lowestCost = min(costs, key=lambda tup: (tup[0], tup[1]))
-    return lowestCost
+def buildStrings(seq1, seq2, cigar, region, gap='-'):
+    alignedChunks = list(aligned_chunks(seq1, seq2, cigar, region, gap))
+    return ''.join(chunk for chunk, _ in alignedChunks), ''.join(chunk for _, chunk in alignedChunks)
 
 
-class CellData:
-    def __init__(self, cost, direction, name, isMatch):
-        self.cost = cost
-        self.direction = direction
-        self.name = name
-        self.isMatch = isMatch
+def buildLoop(path, directions, rowCol, band=-1):
+    row = rowCol[0]
+    col = rowCol[1]
 
-    def getCost(self):
-        return self.cost
+    while row or col:
+        code = int(directions[row, col - row + band if band >= 0 else col])
+        direction = code & DIRECTION_MASK
+        if direction == STOP:
+            # start of a local or semi-global alignment
+            break
+        path.append((direction, bool(code & MATCH), (row, col)))
 
-    def getDirection(self):
-        return self.direction
+        if direction == UP:
+            row -= 1
+        elif direction == LEFT:
+            col -= 1
+        else:
+            row -= 1
+            col -= 1
 
-    def getName(self):
-        return self.name
+    return path
 
-    def getIsMatch(self):
-        return self.isMatch
 
+def sortCosts(topCellCost, leftCellCost, diagonalCellCost):
+    # Same ordering as min() over (cost, direction) pairs: on equal cost the
+    # diagonal wins, then left, then up.
+    if diagonalCellCost <= leftCellCost and diagonalCellCost <= topCellCost:
+        return diagonalCellCost, DIAGONAL
+    if leftCellCost <= topCellCost:
+        return leftCellCost, LEFT
+    return topCellCost, UP
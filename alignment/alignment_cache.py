@@ -0,0 +1,120 @@
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+from alignment import align, align_score
+
+# Bump when engine changes alter results, so older disk entries are not reused
+CACHE_VERSION = 2
+
+# Arguments that change how a result is computed but not the result itself
+IGNORED_ARGUMENTS = ('workers', 'checkpoint_dir', 'profile')
+
+
+class AlignmentCache:
+    """
+        Content-addressed cache in front of align and align_score.
+        Results are keyed by a hash of both sequences and every scoring argument (defaults
+        included, so spelling a default out still hits). The newest max_entries results stay in
+        memory; with a directory they are also written there, one file per key, with an atomic
+        rename so several processes can share the directory. Calls that ask align to profile
+        always run.
+    """
+
+    def __init__(self, max_entries=1024, directory: Path | str | None = None):
+        self.max_entries = max_entries
+        self.directory = Path(directory) if directory is not None else None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def align(self, seq1, seq2, **params):
+        return self.lookup(align, seq1, seq2, params)
+
+    def align_score(self, seq1, seq2, **params):
+        return self.lookup(align_score, seq1, seq2, params)
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'entries': len(self.entries)}
+
+    def clear(self):
+        """ Forget the in-memory entries and counters; the disk store is left alone """
+        self.entries.clear()
+        self.hits = self.disk_hits = self.misses = 0
+
+    def lookup(self, function, seq1, seq2, params):
+        if params.get('profile'):
+            # Timings belong to a run of their own, so profiled calls neither hit nor fill the cache
+            return function(seq1, seq2, **params)
+        key = cacheKey(function, seq1, seq2, params)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        result = self.readDisk(key)
+        if result is not None:
+            self.disk_hits += 1
+            self.hits += 1
+        else:
+            self.misses += 1
+            result = function(seq1, seq2, **params)
+            self.writeDisk(key, result)
+
+        self.entries[key] = result
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return result
+
+    def entryPath(self, key):
+        return self.directory / key[:2] / f'{key}.pkl'
+
+    def readDisk(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.entryPath(key), 'rb') as file:
+                return pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def writeDisk(self, key, result):
+        if self.directory is None:
+            return
+        path = self.entryPath(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Readers only ever see a complete file: write beside it, then rename over it
+        handle, temporary = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                pickle.dump(result, file)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+
+def cacheKey(function, seq1, seq2, params):
+    arguments = inspect.signature(function).bind(seq1, seq2, **params)
+    arguments.apply_defaults()
+
+    digest = hashlib.sha256(f'{CACHE_VERSION}:{function.__name__}'.encode())
+    for name, value in arguments.arguments.items():
+        if name in IGNORED_ARGUMENTS:
+            continue
+        if name in ('seq1', 'seq2'):
+            # A buffer's residues are single bytes, so a str and the buffer
+            # holding its UTF-8 encoding are different sequences
+            encoded = value.encode() if isinstance(value, str) else bytes(value)
+            digest.update(f'{name}:{type(value) is str}:{len(encoded)}:'.encode())
+            digest.update(encoded)
+        else:
+            if isinstance(value, dict):
+                value = sorted(value.items())
+            digest.update(f'{name}={value!r};'.encode())
+    return digest.hexdigest()
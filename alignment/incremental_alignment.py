@@ -0,0 +1,122 @@
+import numpy as np
+
+from alignment import (AlignmentResult, DIAGONAL, DIRECTION_MASK, MATCH, UP, EditScript, buildLoop, buildStrings,
+                       chooseCostType, encodeSequence, matrixCosts, packCells, scanColumn, scoringTable)
+
+
+class IncrementalAligner:
+    """
+        Global alignment of a fixed seq1 against a seq2 that grows at its end, e.g. as reads come in.
+        seq2 is on top of the matrix, so appending residues appends columns: only the new columns are
+        computed, from the last column of costs, which is all that is kept of them. The traceback of
+        every column is kept at 2 bits per cell, so result() traces the current best alignment back
+        without recomputing anything. Scores and alignments are the same as align's full engine.
+    """
+
+    def __init__(self, seq1: str | bytes, seq2: str | bytes = '', match_award=-3, indel_penalty=5, sub_penalty=1,
+                 substitution_matrix=None):
+        self.seq1 = seq1
+        self.seq2 = '' if isinstance(seq1, str) else bytearray()
+        self.match_award = match_award
+        self.indel_penalty = indel_penalty
+        self.sub_penalty = sub_penalty
+        self.substitution_matrix = substitution_matrix
+        # seq2 grows without bound, so the cost type is picked for the widest integers up front
+        self.costType = chooseCostType(np.iinfo(np.int32).max, match_award, indel_penalty, sub_penalty,
+                                       *matrixCosts(substitution_matrix))
+
+        # Residues are coded in order of first appearance, so codes already
+        # handed out stay valid as seq2 brings in new ones
+        self.alphabet = {}
+        self.codes1 = self.encode(seq1)
+        self.table = None
+        self.refreshTable()
+
+        self.lastColumn = indel_penalty * np.arange(len(seq1) + 1, dtype=self.costType)
+        self.traceback = ColumnTraceback(self.codes1)
+        self.cells = 0
+        self.extend(seq2)
+
+    @property
+    def score(self):
+        score = self.lastColumn[-1].item()
+        return float(score) if self.costType is np.float64 else score
+
+    def extend(self, residues: str | bytes):
+        """
+            Append residues to seq2 and compute the matrix columns they add
+        """
+        if isinstance(self.seq2, str):
+            residues = residues if isinstance(residues, str) else bytes(residues).decode('latin-1')
+        else:
+            residues = residues.encode('latin-1') if isinstance(residues, str) else residues
+        codes2 = self.encode(residues)
+        if len(self.alphabet) > len(self.table):
+            self.refreshTable()
+
+        firstCol = len(self.seq2)
+        for offset, residue in enumerate(codes2.tolist(), 1):
+            self.lastColumn, directions = scanColumn(self.lastColumn, (firstCol + offset) * self.indel_penalty,
+                                                     self.table[self.codes1, residue], self.indel_penalty)
+            self.traceback.append(directions, residue)
+        self.seq2 += residues
+        self.cells += len(self.codes1) * len(codes2)
+
+    def result(self, gap='-', output='strings') -> AlignmentResult:
+        """
+            The alignment of seq1 against seq2 as it stands, as align would return it
+            :param gap: the character to use to represent gaps in the alignment strings
+            :param output: "strings" or "cigar", as for align
+        """
+        rowCol = (len(self.seq1), len(self.seq2))
+        path = buildLoop(EditScript(), self.traceback, rowCol)
+        region = path.region(rowCol)
+        cigar = path.cigar()
+        if output == 'strings':
+            aligned1, aligned2 = buildStrings(self.seq1, self.seq2, cigar, region, gap)
+        elif output == 'cigar':
+            aligned1 = aligned2 = None
+        else:
+            raise ValueError(f'Unknown alignment output: {output!r}')
+        return AlignmentResult(self.score, aligned1, aligned2, region, self.cells, cigar)
+
+    def encode(self, seq):
+        codePoints = encodeSequence(seq)
+        for codePoint in np.unique(codePoints).tolist():
+            self.alphabet.setdefault(codePoint, len(self.alphabet))
+        lookup = self.alphabet.get
+        return np.array([lookup(codePoint) for codePoint in codePoints.tolist()], dtype=np.intp)
+
+    def refreshTable(self):
+        self.table = scoringTable(np.array(list(self.alphabet), dtype=np.uint32), self.costType,
+                                  self.match_award, self.sub_penalty, self.substitution_matrix)
+
+
+class ColumnTraceback:
+    # Traceback of a matrix that grows a column at a time: PackedTraceback's
+    # 2 bits per cell, packed down each column instead of along each row, with
+    # room for twice as many columns made whenever it fills up. Column 0 is
+    # the all-UP left edge, so it is not stored.
+    def __init__(self, codes1):
+        self.codes1 = codes1
+        self.width = (len(codes1) + 4) // 4
+        self.packed = np.zeros((16, self.width), dtype=np.uint8)
+        self.codes2 = np.zeros(16, dtype=np.intp)
+        self.columns = 0
+
+    def append(self, directions, residue):
+        if self.columns == len(self.packed):
+            self.packed = np.concatenate((self.packed, np.zeros_like(self.packed)))
+            self.codes2 = np.concatenate((self.codes2, np.zeros_like(self.codes2)))
+        self.packed[self.columns] = packCells(directions, self.width)
+        self.codes2[self.columns] = residue
+        self.columns += 1
+
+    def __getitem__(self, index):
+        row, col = index
+        if col == 0:
+            return UP if row else 0
+        code = (int(self.packed[col - 1, row >> 2]) >> ((row & 3) << 1)) & DIRECTION_MASK
+        if code == DIAGONAL and self.codes1[row - 1] == self.codes2[col - 1]:
+            code |= MATCH
+        return code
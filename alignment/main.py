@@ -2,6 +2,7 @@ from argparse import ArgumentParser
 from pathlib import Path
 
 from alignment import align
+from sequence_loader import load_sequence
 
 
 def main(seq1: str, seq2: str):
@@ -16,7 +17,7 @@ def main(seq1: str, seq2: str):
 
 def _content_or_string(could_be_path):
     if (s1file := Path(could_be_path)).exists():
-        return s1file.read_text()
+        return load_sequence(s1file)
     else:
         # assume it's the sequence string, not a file name
         return could_be_path
@@ -0,0 +1,195 @@
+import os
+import re
+
+import numpy as np
+
+from alignment import (DIAGONAL, LEFT, UP, EditScript, PackedTraceback, align_many, buildLoop, chooseCostType,
+                       encodeSequence, matrixCosts, scoringTable)
+
+
+def align_multiple(
+        sequences,
+        match_award=-3,
+        indel_penalty=5,
+        sub_penalty=1,
+        substitution_matrix=None,
+        banded_width=-1,
+        gap='-',
+        workers=None,
+) -> list[str]:
+    """
+        Progressive multiple alignment.
+        Every pair is scored with align_score across a process pool (see align_many), the scores become
+        distances for a UPGMA guide tree, and the tree's merges are replayed in order, each aligning two
+        profiles (groups of already aligned sequences) with the same recurrence as calculateCosts. A
+        profile column is scored by sum of pairs: the cost of every residue pair across the two columns,
+        indel_penalty for a residue against a gap, and nothing for two gaps.
+        :param sequences: the sequences to align, str or bytes-like as for align
+        :param match_award: how many points to award a match
+        :param indel_penalty: how many points to award a gap
+        :param sub_penalty: how many points to award a substitution
+        :param substitution_matrix: a mapping from (residue1, residue2) to the cost of aligning them, as for align
+        :param banded_width: banded_width for the pairwise scores, as for align_score ("auto" included)
+        :param gap: the character to use to represent gaps
+        :param workers: number of worker processes for the pairwise scores; defaults to the CPU count
+        :return: the aligned sequences, all the same length, in the order given
+    """
+    sequences = list(sequences)
+    if not sequences:
+        return []
+    alphabet, profiles = encodeProfiles(sequences)
+    costType = chooseCostType(len(sequences) ** 2 * max(len(profile[0]) for profile in profiles),
+                              match_award, indel_penalty, sub_penalty, *matrixCosts(substitution_matrix))
+    table = scoringTable(alphabet, costType, match_award, sub_penalty, substitution_matrix)
+
+    distances = pairwise_distances(sequences, workers, match_award=match_award, indel_penalty=indel_penalty,
+                                   sub_penalty=sub_penalty, substitution_matrix=substitution_matrix,
+                                   banded_width=banded_width)
+    members = [[index] for index in range(len(sequences))]
+    for first, second in guide_tree(distances):
+        profiles.append(alignProfiles(profiles[first], profiles[second], table, indel_penalty))
+        members.append(members[first] + members[second])
+
+    # The last profile holds every sequence, in merge order
+    aligned = profiles[-1]
+    characters = np.array([chr(code) for code in alphabet.tolist()] + [gap])
+    rows = [''.join(characters[codes]) for codes in aligned]
+    order = np.argsort(members[-1])
+    return [rows[row] for row in order]
+
+
+def pairwise_distances(sequences, workers=None, **params) -> np.ndarray:
+    """
+        Distances between all pairs of sequences, from align_score run across a process pool.
+        A pair's cost is measured against the mean cost of aligning each sequence with itself and
+        divided by their mean length, so related pairs are near 0 whatever their lengths.
+        :param sequences: the sequences to compare
+        :param workers: number of worker processes; defaults to the CPU count
+        :param params: keyword arguments for align_score
+        :return: a symmetric matrix of distances with 0 on the diagonal
+    """
+    sequences = list(sequences)
+    pairs = [(first, second) for first in range(len(sequences)) for second in range(first + 1, len(sequences))]
+    # Pairs of long sequences take long enough that a chunk of one balances best
+    chunk_size = max(1, min(16, len(pairs) // (4 * (workers or os.cpu_count() or 1))))
+    scores = align_many(((sequences[first], sequences[second]) for first, second in pairs), workers,
+                        chunk_size, score_only=True, **params)
+
+    selfScores = [selfScore(sequence, **params) for sequence in sequences]
+    distances = np.zeros((len(sequences), len(sequences)))
+    for (first, second), score in zip(pairs, scores):
+        meanLength = max(1, (len(sequences[first]) + len(sequences[second])) / 2)
+        distances[first, second] = distances[second, first] = \
+            (score - (selfScores[first] + selfScores[second]) / 2) / meanLength
+    return distances
+
+
+def selfScore(sequence, match_award=-3, substitution_matrix=None, **_):
+    # The cost of a sequence against itself: every residue on the diagonal
+    alphabet, codes = np.unique(encodeSequence(sequence), return_inverse=True)
+    table = scoringTable(alphabet, np.float64, match_award, 0, substitution_matrix)
+    return np.diag(table)[codes].sum()
+
+
+def guide_tree(distances) -> list[tuple[int, int]]:
+    """
+        Build a UPGMA guide tree from a distance matrix.
+        Clusters 0..n-1 are the sequences; merge k creates cluster n + k from the closest pair of
+        clusters, and the distance from the new cluster to any other is the size-weighted mean of its
+        two parts'. Ties go to the lowest cluster numbers.
+        :param distances: a symmetric n x n matrix
+        :return: the n - 1 merges as (cluster, cluster) pairs, in order
+    """
+    count = len(distances)
+    matrix = np.full((2 * count - 1, 2 * count - 1), np.inf)
+    matrix[:count, :count] = distances
+    np.fill_diagonal(matrix, np.inf)
+    sizes = np.zeros(2 * count - 1)
+    sizes[:count] = 1
+
+    merges = []
+    for merged in range(count, 2 * count - 1):
+        first, second = np.unravel_index(np.argmin(matrix), matrix.shape)
+        first, second = sorted((int(first), int(second)))
+        row = (sizes[first] * matrix[first] + sizes[second] * matrix[second]) / (sizes[first] + sizes[second])
+        row[[first, second]] = np.inf
+        matrix[merged, :merged] = matrix[:merged, merged] = row[:merged]
+        matrix[[first, second], :] = matrix[:, [first, second]] = np.inf
+        sizes[merged] = sizes[first] + sizes[second]
+        merges.append((first, second))
+    return merges
+
+
+def encodeProfiles(sequences):
+    # Every sequence as a one-row profile of codes into the shared alphabet;
+    # the code len(alphabet) is a gap
+    encoded = [encodeSequence(sequence) for sequence in sequences]
+    alphabet, codes = np.unique(np.concatenate(encoded), return_inverse=True)
+    bounds = np.cumsum([0] + [len(sequence) for sequence in encoded])
+    return alphabet, [codes[start:end].reshape(1, -1) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def columnCounts(profile, residues):
+    # counts[col, code] for codes 0..residues, the last being the gap
+    counts = np.zeros((profile.shape[1], residues + 1), dtype=np.int64)
+    for code in range(residues + 1):
+        counts[:, code] = (profile == code).sum(axis=0)
+    return counts
+
+
+def alignProfiles(profile1, profile2, table, indel_penalty):
+    # calculateCosts' recurrence with sum-of-pairs costs, a row at a time as in
+    # scanRow. Costs are totals over all |profile1| * |profile2| pairs rather
+    # than means, so integer penalties keep the arithmetic (and its ties) exact.
+    # An up step puts profile1's column against gaps, a left step profile2's.
+    residues = len(table)
+    counts1 = columnCounts(profile1, residues)
+    counts2 = columnCounts(profile2, residues)
+    residues1 = counts1[:, :residues].sum(axis=1)
+    residues2 = counts2[:, :residues].sum(axis=1)
+    upCosts = indel_penalty * residues1 * len(profile2)
+    leftCosts = indel_penalty * residues2 * len(profile1)
+    # Profile-wide (residue, residue) costs of one profile1 column against every profile2 column
+    pairCosts = table @ counts2[:, :residues].T
+    gaps2 = counts2[:, residues]
+
+    rows, cols = profile1.shape[1], profile2.shape[1]
+    costType = table.dtype
+    offsets = np.concatenate(([0], np.cumsum(leftCosts))).astype(costType)
+    directions = PackedTraceback(np.zeros(rows, dtype=np.uint8), np.ones(cols, dtype=np.uint8))
+    previousRow = offsets.copy()
+    directions.setRow(0, [0] + [LEFT] * cols)
+
+    for row in range(1, rows + 1):
+        column = counts1[row - 1]
+        substitution = (column[:residues] @ pairCosts
+                        + indel_penalty * (residues1[row - 1] * gaps2 + column[residues] * residues2))
+        diagonalCellCost = previousRow[:-1] + substitution
+        topCellCost = previousRow[1:] + upCosts[row - 1]
+
+        currentRow = np.empty_like(previousRow)
+        currentRow[0] = previousRow[0] + upCosts[row - 1]
+        np.minimum(diagonalCellCost, topCellCost, out=currentRow[1:])
+        currentRow -= offsets
+        np.minimum.accumulate(currentRow, out=currentRow)
+        currentRow += offsets
+
+        rowDirections = np.full(cols + 1, UP, dtype=np.uint8)
+        rowDirections[1:][currentRow[:-1] + leftCosts == currentRow[1:]] = LEFT
+        rowDirections[1:][diagonalCellCost == currentRow[1:]] = DIAGONAL
+        directions.setRow(row, rowDirections)
+        previousRow = currentRow
+
+    return mergeProfiles(profile1, profile2, buildLoop(EditScript(), directions, (rows, cols)).cigar(), residues)
+
+
+def mergeProfiles(profile1, profile2, cigar, gapCode):
+    # Lay both profiles out along the aligned columns, filling gap columns with gapCode
+    runs = re.findall(r'(\d+)([=XID])', cigar)
+    operations = np.repeat([operation for _, operation in runs], [int(length) for length, _ in runs])
+    used1 = operations != 'I'
+    used2 = operations != 'D'
+    merged = np.full((len(profile1) + len(profile2), len(operations)), gapCode, dtype=profile1.dtype)
+    merged[:len(profile1), used1] = profile1
+    merged[len(profile1):, used2] = profile2
+    return merged
@@ -0,0 +1,137 @@
+import heapq
+from itertools import islice
+
+import numpy as np
+
+from alignment import MODES, chooseCostType, encodeSequence, matrixCosts, scoringTable
+
+
+class QueryProfile:
+    """
+        One query prepared for scoring against many database sequences.
+        The query is encoded once into a profile: for every residue a target may hold, the row of
+        diagonal costs against each query position. Targets are then scored with the score-only
+        recurrence of align_score, vectorized across a batch of targets at a time rather than
+        along a single row, so short targets cost few NumPy calls each.
+        Scores are those of align_score(query, target, ...) with linear gap costs and no band.
+    """
+
+    def __init__(self, query: str | bytes, match_award=-3, indel_penalty=5, sub_penalty=1,
+                 substitution_matrix=None, mode='global'):
+        if mode not in MODES:
+            raise ValueError(f'Unknown alignment mode: {mode!r}')
+        self.query = query
+        self.match_award = match_award
+        self.indel_penalty = indel_penalty
+        self.sub_penalty = sub_penalty
+        self.substitution_matrix = substitution_matrix
+        self.mode = mode
+        self.costType = chooseCostType(0, match_award, indel_penalty, sub_penalty, *matrixCosts(substitution_matrix))
+
+        self.queryAlphabet, self.queryCodes = np.unique(encodeSequence(query), return_inverse=True)
+        # Profile rows are added as targets bring in residues; rows maps a code point to its row
+        self.rows = {}
+        self.profile = np.empty((0, len(self.queryCodes)))
+
+    def scan(self, targets, top_k=10, batch_size=64):
+        """
+            Score every target against the query and keep the best.
+            :param targets: an iterable of sequences, e.g. from sequence_loader.read_sequences; it is
+                consumed lazily, a few batches at a time
+            :param top_k: how many hits to return
+            :param batch_size: how many targets are scored together
+            :return: up to top_k (index, score) pairs, lowest cost first (ties by index)
+        """
+        targets = iter(targets)
+        hits = []
+        offset = 0
+        # Targets of similar length share a batch, so little of it is padding
+        for chunk in iter(lambda: list(islice(targets, 16 * batch_size)), []):
+            order = sorted(range(len(chunk)), key=lambda index: len(chunk[index]))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                scores = self.scoreBatch([self.encode(chunk[index]) for index in batch])
+                hits.extend(zip(scores.tolist(), (offset + index for index in batch)))
+            hits = heapq.nsmallest(top_k, hits)
+            offset += len(chunk)
+        return [(index, self.convert(score)) for score, index in hits]
+
+    def score(self, target):
+        """ The cost of aligning the query against one target """
+        return self.convert(self.scoreBatch([self.encode(target)])[0].item())
+
+    def convert(self, score):
+        if self.costType is np.float64:
+            return score
+        return int(score)
+
+    def encode(self, target):
+        # Profile rows of a target's residues, adding rows for residues not seen before
+        codePoints, inverse = np.unique(encodeSequence(target), return_inverse=True)
+        new = [codePoint for codePoint in codePoints.tolist() if codePoint not in self.rows]
+        if new:
+            self.profile = np.concatenate((self.profile, [self.profileRow(codePoint) for codePoint in new]))
+            for codePoint in new:
+                self.rows[codePoint] = len(self.rows)
+        return np.array([self.rows[codePoint] for codePoint in codePoints.tolist()], dtype=np.intp)[inverse]
+
+    def profileRow(self, codePoint):
+        # The cost of pairing each query residue (seq1) with this target residue (seq2)
+        found = np.flatnonzero(self.queryAlphabet == codePoint)
+        alphabet = self.queryAlphabet if len(found) else np.append(self.queryAlphabet, codePoint)
+        table = scoringTable(alphabet, np.float64, self.match_award, self.sub_penalty, self.substitution_matrix)
+        return table[self.queryCodes, found[0] if len(found) else -1]
+
+    def scoreBatch(self, batch):
+        # The rows of all targets in the batch advance together, one (targets x query)
+        # array per row; a target's score is read off when its last row is reached.
+        # Rows are kept less the running gap cost of their column (cell j holds
+        # cost - j * indel_penalty), as in scanRow, so the up and left chains need
+        # no shifting in and out: the profile carries the shift of the diagonal step.
+        cols = len(self.queryCodes)
+        lengths = np.array([len(codes) for codes in batch])
+        codes = np.zeros((len(batch), lengths.max(initial=0)), dtype=np.intp)
+        for target, targetCodes in enumerate(batch):
+            codes[target, :len(targetCodes)] = targetCodes
+
+        costType = self.costType
+        if costType is not np.float64:
+            # int32 when the longest path allows, which halves the memory traffic
+            costType = chooseCostType(cols + codes.shape[1], self.match_award, self.indel_penalty, self.sub_penalty,
+                                      *matrixCosts(self.substitution_matrix))
+        profile = (self.profile - self.indel_penalty).astype(costType)
+        steps = self.indel_penalty * np.arange(cols + 1, dtype=costType)
+        edgePenalty = self.indel_penalty if self.mode == 'global' else 0
+        previousRows = np.tile((edgePenalty - self.indel_penalty) * np.arange(cols + 1, dtype=costType),
+                               (len(batch), 1))
+        best = np.zeros(len(batch), dtype=costType)
+        scores = np.empty(len(batch))
+        self.readScores(scores, lengths == 0, previousRows, steps, best)
+
+        for row in range(1, codes.shape[1] + 1):
+            currentRows = np.empty_like(previousRows)
+            currentRows[:, 0] = row * edgePenalty
+            np.minimum(previousRows[:, :-1] + profile[codes[:, row - 1]], previousRows[:, 1:] + self.indel_penalty,
+                       out=currentRows[:, 1:])
+            if self.mode == 'local':
+                np.minimum(currentRows, -steps, out=currentRows)
+            np.minimum.accumulate(currentRows, axis=1, out=currentRows)
+
+            if self.mode == 'local':
+                np.minimum(best, (currentRows + steps).min(axis=1), out=best)
+            elif self.mode == 'semiglobal':
+                np.minimum(best, currentRows[:, -1] + steps[-1], out=best)
+            self.readScores(scores, lengths == row, currentRows, steps, best)
+            previousRows = currentRows
+
+        return scores
+
+    def readScores(self, scores, finished, rows, steps, best):
+        if not finished.any():
+            return
+        if self.mode == 'local':
+            scores[finished] = best[finished]
+        elif self.mode == 'semiglobal':
+            scores[finished] = np.minimum(best[finished], (rows[finished] + steps).min(axis=1))
+        else:
+            scores[finished] = rows[finished, -1] + steps[-1]
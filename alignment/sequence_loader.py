@@ -0,0 +1,58 @@
+import mmap
+import re
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+# Bytes dropped from sequence lines: line breaks and any other ASCII whitespace
+WHITESPACE = np.zeros(256, dtype=bool)
+WHITESPACE[list(b' \t\n\r\v\f')] = True
+
+
+def read_sequences(file: Path | str) -> Iterator[tuple[str | None, bytes]]:
+    """
+        Lazily iterate the records of a sequence file.
+        The file is memory-mapped; each record's residues are copied once into a compact
+        bytes buffer with line breaks removed. A file without FASTA headers is one record.
+        :param file: path to a plain or FASTA sequence file
+        :return: an iterator of (header, sequence) pairs; header is None for plain files
+    """
+    with open(file, 'rb') as handle:
+        if not Path(file).stat().st_size:
+            return
+
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = np.frombuffer(mapped, dtype=np.uint8)
+            try:
+                # Blank lines before the first record are not a record of their own
+                firstResidue = re.search(rb'\S', mapped)
+                position = firstResidue.start() if firstResidue else len(mapped)
+                while position < len(mapped):
+                    header = None
+                    if mapped[position] == ord('>'):
+                        lineEnd = mapped.find(b'\n', position)
+                        lineEnd = len(mapped) if lineEnd == -1 else lineEnd
+                        header = mapped[position + 1:lineEnd].decode().strip()
+                        position = lineEnd + 1
+
+                    # Start from the header's own line break so an empty record is found too
+                    recordEnd = mapped.find(b'\n>', position - 1 if header is not None else position)
+                    recordEnd = len(mapped) if recordEnd == -1 else recordEnd + 1
+
+                    yield header, compactResidues(data[position:recordEnd])
+                    position = recordEnd
+            finally:
+                # The mapping cannot close while a NumPy view still exports it
+                del data
+
+
+def load_sequence(file: Path | str) -> bytes:
+    """
+        Load the first record of a plain or FASTA sequence file as a bytes buffer
+    """
+    return next((sequence for _, sequence in read_sequences(file)), b'')
+
+
+def compactResidues(record):
+    return record[~WHITESPACE[record]].tobytes()
@@ -1,92 +1,174 @@
-from pprint import pprint
-from time import time
-
+import json
+import math
+import platform
+import sys
+import tracemalloc
+from argparse import ArgumentParser
 from pathlib import Path
+from time import perf_counter
 
-from alignment import align
+import numpy as np
 
+from alignment import align, align_score, bandCells
+from sequence_loader import load_sequence
 
-def _analyze_alignment(N: int, algorithm, **kwargs):
-    def read_sequence(file: Path) -> str:
-        return ''.join(file.read_text().splitlines())
+# name -> (function, keyword arguments). Banded runs use the width of the core banded tests.
+ENGINES = {
+    'full': (align, {}),
+    'wavefront': (align, {'engine': 'wavefront'}),
+    'linear_space': (align, {'engine': 'linear_space'}),
+    'xdrop': (align, {'engine': 'xdrop'}),
+    'banded': (align, {'banded_width': 3}),
+    'affine': (align, {'gap_open_penalty': 3}),
+    'score_only': (align_score, {}),
+    'score_only_banded': (align_score, {'banded_width': 3}),
+    # Four-Russians needs a substitution priced as two gaps (or one, or a match),
+    # so it is timed against score_only (its like for like) and wavefront on
+    # those costs rather than the defaults
+    'indel_score_only': (align_score, {'sub_penalty': 10}),
+    'indel_wavefront': (align, {'engine': 'wavefront', 'sub_penalty': 10}),
+    'indel_four_russians': (align_score, {'engine': 'four_russians', 'sub_penalty': 10}),
+}
 
-    seq1 = read_sequence(Path('test_files/bovine_coronavirus.txt'))[:N]
-    seq2 = read_sequence(Path('test_files/murine_hepatitus.txt'))[:N]
-    start = time()
-    algorithm(seq1, seq2, **kwargs)
-    end = time()
-    runtime = end - start
-    return N, runtime
-
-
-def _compute_average_runtimes(runtimes):
-    groups = {}
-    for n, runtime in runtimes:
-        key = n
-        if key not in groups:
-            groups[key] = []
-        groups[key].append((n, runtime))
-
-    return [
-        (
-            size,
-            round(sum(t for _, t in stats) / len(stats), 3)
-        )
-        for size, stats in groups.items()
-    ]
+# The sizes of the massive_* expected results in test_files
+MASSIVE_SIZES = [10, 100, 1000, 10000, 20000, 25000, 31000]
+
+PERCENTILES = (50, 90, 99)
+
+
+def _load_pair(N: int):
+    seq1 = load_sequence(Path('test_files/bovine_coronavirus.txt'))[:N]
+    seq2 = load_sequence(Path('test_files/murine_hepatitus.txt'))[:N]
+    return seq1, seq2
 
 
-def _print_markdown_table(ave_runtimes, headers):
+def _benchmark(engine: str, N: int, repeats: int, warmup: int):
+    algorithm, kwargs = ENGINES[engine]
+    seq1, seq2 = _load_pair(N)
+
+    for _ in range(warmup):
+        algorithm(seq1, seq2, **kwargs)
+
+    # align times its own phases at no measurable cost; the last timed run's go in the report
+    timed_kwargs = {**kwargs, 'profile': True} if algorithm is align else kwargs
+    runtimes = []
+    for _ in range(repeats):
+        start = perf_counter()
+        result = algorithm(seq1, seq2, **timed_kwargs)
+        runtimes.append(perf_counter() - start)
+
+    # A separate traced run, so tracemalloc's overhead stays out of the timings
+    tracemalloc.start()
+    algorithm(seq1, seq2, **kwargs)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if algorithm is align:
+        score, cells = result[0], result.cells
+    else:
+        score, cells = result, bandCells(len(seq1), len(seq2), kwargs.get('banded_width', -1))
+    median = float(np.percentile(runtimes, 50))
+    return {
+        'engine': engine,
+        'N': N,
+        'repeats': repeats,
+        'warmup': warmup,
+        # JSON has no infinity, so a score with no alignment (e.g. xdrop dropping the corner) is null
+        'score': score if math.isfinite(score) else None,
+        **{f'p{percentile}': float(np.percentile(runtimes, percentile)) for percentile in PERCENTILES},
+        'min': min(runtimes),
+        'mean': sum(runtimes) / len(runtimes),
+        'peak_memory_bytes': peak_memory,
+        'cells': cells,
+        'cells_per_second': cells / median if median else None,
+        'phases': result.phases if algorithm is align else None,
+    }
+
+
+def _find_regressions(results, baseline, threshold):
+    # A case regresses when its median is more than threshold times the baseline median
+    previous = {(case['engine'], case['N']): case for case in baseline['results']}
+    regressions = []
+    for case in results:
+        before = previous.get((case['engine'], case['N']))
+        if before and case['p50'] > before['p50'] * threshold:
+            regressions.append((case['engine'], case['N'], before['p50'], case['p50']))
+    return regressions
+
+
+def _print_markdown_table(rows, headers):
     header_widths = [len(header) for header in headers]
 
-    rows = [
+    lines = [
         '| ' + ' | '.join(headers) + ' |',
         '| ' + ' | '.join('-' * len(header) for header in headers) + ' |'
     ]
 
-    rows += (
+    lines += (
         '| ' + ' | '.join(
             f'{field:<{width}}'
             for field, width in zip(row, header_widths)
         ) + ' |'
-        for row in ave_runtimes
+        for row in rows
     )
 
-    print('\n'.join(rows))
+    print('\n'.join(lines))
 
 
-def main(sizes, algorithm, file_name="_runtimes.py", **kwargs):
-
-    runtimes = []
-    for size in sizes:
-        print('Running with size', size)
-        for iteration in range(10):
-            n, runtime = _analyze_alignment(size, algorithm, **kwargs)
-            runtimes.append((n, runtime))
-
-    ave_runtimes = _compute_average_runtimes(runtimes)
+def main(sizes, engines, repeats=5, warmup=1, file_name='_runtimes.json', baseline=None, threshold=1.25):
+    results = []
+    for engine in engines:
+        for size in sizes:
+            print(f'Running {engine} with size {size}')
+            results.append(_benchmark(engine, size, repeats, warmup))
 
     print()
     print('Copy this markdown table into your report:  ')
-    print()
-
     print()
     _print_markdown_table(
-        ave_runtimes,
-        [' N     ', 'Time (sec)']
+        [(case['engine'], case['N'], f"{case['p50']:.4f}", f"{case['p90']:.4f}",
+          f"{case['peak_memory_bytes'] / 2 ** 20:.1f}", f"{case['cells_per_second'] or 0:.3g}")
+         for case in results],
+        ['Engine             ', ' N     ', 'p50 (sec)', 'p90 (sec)', 'Peak MiB', 'Cells/sec']
     )
 
-    # Print runtimes to a file
+    report = {
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'machine': platform.platform(),
+        'results': results,
+    }
     with open(file_name, 'w') as file:
-        print('runtimes = ', end='', file=file)
-        pprint(runtimes, file)
-
+        json.dump(report, file, indent=2, allow_nan=False)
     print()
     print(f'{file_name} written')
 
+    if baseline is None:
+        return []
 
-if __name__ == '__main__':
-    sizes = [500, 1000, 1500, 2000, 2500, 3000]
+    with open(baseline) as file:
+        regressions = _find_regressions(results, json.load(file), threshold)
+    print()
+    for engine, size, before, after in regressions:
+        print(f'REGRESSION {engine} N={size}: {before:.4f}s -> {after:.4f}s ({after / before:.2f}x)')
+    if not regressions:
+        print(f'No regressions against {baseline}')
+    return regressions
 
-    main(sizes=sizes,
-         algorithm=align)
\ No newline at end of file
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the alignment engines on the bovine/murine test files')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 1000, 1500, 2000, 2500, 3000])
+    parser.add_argument('--massive', action='store_true', help='use the massive_* sizes instead of --sizes')
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--repeats', type=int, default=5, help='timed runs per case')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed runs before timing each case')
+    parser.add_argument('--output', default='_runtimes.json', help='where to write the JSON results')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='flag cases whose median is this many times the baseline median')
+    args = parser.parse_args()
+
+    regressions = main(MASSIVE_SIZES if args.massive else args.sizes, args.engines, args.repeats, args.warmup,
+                       args.output, args.baseline, args.threshold)
+    sys.exit(1 if regressions else 0)
@@ -1,7 +1,7 @@
 # ---------------------------------- Imports --------------------------------- #
 import math
 from pathlib import Path
-from test_utils import Timer
+from test_utils import Timer, score_alignment
 
 import pytest
 from byu_pytest_utils import with_import, test_files, tier
@@ -200,107 +200,224 @@ def test_large_dna_alignment(align):
             pytest.fail(f"The alignment of size {N} took too long")
 
 
-# # -------------------------------- Core tests -------------------------------- #
-# @core
-# @with_import('alignment')
-# def test_small_dna_alignment_banded(align):
-#     score, aseq1, aseq2 = align('GGGGTTTTAAAACCCCTTTT', 'TTTTAAAACCCCTTTTGGGG', banded_width=2)
-#     assert score == 6
-#     assert aseq1 == 'GGGGTTTTAAAACCCCTT--TT'
-#     assert aseq2 == '--TTTTAAAACCCCTTTTGGGG'
-#
-#
-# @core
-# @with_import('alignment')
-# def test_length_discrepancy_banded(align):
-#     score, aseq1, aseq2 = align('AAAA', 'AAAHHHAHHHHHHHHHHHHHHHHHH', banded_width=2)
-#     assert score == math.inf
-#     assert aseq1 == None
-#     assert aseq2 == None
-#
-#
-# @core
-# @with_import('alignment')
-# def test_alignment_changes_with_banded_width(align):
-#     # banded width 1
-#     score_narrow, a1_narrow, a2_narrow = align('tcgctcatatatccc', 'atataccctggggtg', banded_width=1, match_award=-1,
-#                                                sub_penalty=1, indel_penalty=1)
-#     assert score_narrow == 10
-#     assert a1_narrow == '-tcgctcatatatccc'
-#     assert a2_narrow == 'atataccct-ggggtg'
-#
-#     # banded width 2
-#     score_mid, a1_mid, a2_mid = align('tcgctcatatatccc', 'atataccctggggtg', banded_width=2, match_award=-1,
-#                                       sub_penalty=1, indel_penalty=1)
-#     assert score_mid == 8
-#     assert a1_mid == '-t-cgctcat-atatccc'
-#     assert a2_mid == 'atatac-cctggggt--g'
-#
-#     # banded width 7
-#     score_wide, a1_wide, a2_wide = align("tcgctcatatatccc", "atataccctggggtg", banded_width=7, match_award=-1,
-#                                          sub_penalty=1, indel_penalty=1)
-#     assert score_wide == 6
-#     assert a1_wide == 'tcgctcatatatccc-------'
-#     assert a2_wide == '------atata-ccctggggtg'
-#
-#
-# @core
-# @with_import('alignment')
-# def test_medium_dna_alignment_banded(align):
-#     seq1 = 'ataagagtgattggcgatatcggctccgtacgtaccctttctactctcgggctcttccccgttagtttaaatctaatctctttataaacggcacttcc'
-#     seq2 = 'ataagagtgattggcgtccgtacgtaccctttctactctcaaactcttgttagtttaaatctaatctaaactttataaacggcacttcctgtgtgtccat'
-#
-#     score, aseq1, aseq2 = align(seq1, seq2, banded_width=2)
-#
-#     expected_align1 = 'ataagagtgattggcg-atatcggctccgtacgtaccctttctactctcgggctcttccccgttagtttaaatctaatctctttataaacggcacttcc--'
-#     expected_align2 = 'ataagagtgattggcgtccgtacgtaccctttctactc-tcaaactcttgttagtttaaatctaatctaaactttataaacggcacttcctgtgtgtccat'
-#
-#     assert score == -79
-#     assert aseq1 == expected_align1
-#     assert aseq2 == expected_align2
-#
-#
-# @core
-# @with_import('alignment')
-# def test_massive_dna_alignment_banded(align):
-#     timer = Timer()
-#     for N in [10, 100, 1000, 10000, 20000, 25000, 31000]:
-#         timer.start_lap()
-#         seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:N]
-#         seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:N]
-#
-#         score, aseq1, aseq2 = align(seq1, seq2, banded_width=3)
-#
-#         with open(test_files / f'massive_bovine_murine_align_{N}.txt') as file:
-#             expected_score, expected_align1, expected_align2 = file.read().splitlines()
-#
-#         assert score == int(expected_score)
-#         assert aseq1 == expected_align1
-#         assert aseq2 == expected_align2
-#
-#         if timer.lap_time() > 10:
-#             pytest.fail(f"The unrestricted alignment of size {N} took too long")
-#
-#
-# # ------------------------------ Stretch 2 tests ----------------------------- #
-# @stretch2
-# @with_import('alignment')
-# def test_small_dna_alignment_open_gap(align):
-#     score, aseq1, aseq2 = align('GGGGTTTTAAAACCCCTTTT', 'TTTTAAAACCCCTTTTGGGG', gap_open_penalty=10, indel_penalty=.5)
-#     assert score == -24
-#     assert aseq1 == 'GGGGTTTTAAAACCCCTTTT----'
-#     assert aseq2 == '----TTTTAAAACCCCTTTTGGGG'
-#
-#
-# @stretch2
-# @with_import('alignment')
-# def test_small_dna_alignment_gap_open(align):
-#     score, seq1, seq2 = align('tcgctcatatatccc', 'atataccctggggtg', gap_open_penalty=10, indel_penalty=.5)
-#     assert score == 7
-#     assert seq1 == 'tcgctcatatatcc------c'
-#     assert seq2 == '------atataccctggggtg'
-#
-#
+@baseline
+@with_import('alignment')
+def test_wavefront_engine_matches_full(align):
+    for seq1, seq2, kwargs in [
+        ('polynomial', 'exponential', {}),
+        ('ABDE', 'BADE', dict(match_award=-2, sub_penalty=4, indel_penalty=5)),
+        ('AT', 'AG', dict(sub_penalty=15)),
+        ('AAAA', 'CCCC', dict(match_award=-1, indel_penalty=1, sub_penalty=5)),
+        ('ACGT', '', {}),
+        ('', '', {}),
+    ]:
+        assert align(seq1, seq2, engine='wavefront', **kwargs) == align(seq1, seq2, **kwargs)
+
+
+@baseline
+@with_import('alignment')
+def test_large_dna_alignment_wavefront(align):
+    timer = Timer()
+    for N in [10, 100, 1000, 1500, 2000, 3000]:
+        timer.start_lap()
+        seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:N]
+        seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:N]
+
+        score, aseq1, aseq2 = align(seq1, seq2, engine='wavefront')
+
+        with open(test_files / f'large_bovine_murine_align_{N}.txt') as file:
+            expected_score, expected_align1, expected_align2 = file.read().splitlines()
+
+        assert score == int(expected_score)
+        assert aseq1 == expected_align1
+        assert aseq2 == expected_align2
+
+        if timer.lap_time() > 12:
+            pytest.fail(f"The wavefront alignment of size {N} took too long")
+
+
+@baseline
+@with_import('alignment')
+def test_linear_space_engine_matches_full(align):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')
+    for start, N, kwargs in [
+        (0, 300, {}),
+        (500, 250, dict(match_award=-2, sub_penalty=4, indel_penalty=5)),
+        (900, 200, dict(match_award=-1, sub_penalty=5, indel_penalty=1)),
+        (1300, 350, dict(match_award=0, sub_penalty=1, indel_penalty=1)),
+    ]:
+        a = seq1[start:start + N]
+        b = seq2[start:start + N * 2 // 3]
+        assert align(a, b, engine='linear_space', **kwargs) == align(a, b, engine='wavefront', **kwargs)
+
+    assert align('ACGT', '', engine='linear_space') == (20, 'ACGT', '----')
+    assert align('', '', engine='linear_space') == (0, '', '')
+
+
+@baseline
+@with_import('alignment')
+def test_large_dna_alignment_linear_space(align):
+    for N in [1000, 3000]:
+        seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:N]
+        seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:N]
+
+        score, aseq1, aseq2 = align(seq1, seq2, engine='linear_space')
+
+        with open(test_files / f'large_bovine_murine_align_{N}.txt') as file:
+            expected_score, expected_align1, expected_align2 = file.read().splitlines()
+
+        assert score == int(expected_score)
+        assert aseq1 == expected_align1
+        assert aseq2 == expected_align2
+
+
+@baseline
+@with_import('alignment')
+def test_tiled_engine_matches_full(align):
+    for seq1, seq2, kwargs in [
+        ('polynomial', 'exponential', {}),
+        ('ABDE', 'BADE', dict(match_award=-2, sub_penalty=4, indel_penalty=5)),
+        ('ACGT', '', {}),
+        ('', 'ACGT', {}),
+        ('', '', {}),
+    ]:
+        assert align(seq1, seq2, engine='tiled', workers=1, **kwargs) == align(seq1, seq2, **kwargs)
+
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:3000]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:3000]
+    score, aseq1, aseq2 = align(seq1, seq2, engine='tiled', workers=2)
+
+    with open(test_files / 'large_bovine_murine_align_3000.txt') as file:
+        expected_score, expected_align1, expected_align2 = file.read().splitlines()
+
+    assert score == int(expected_score)
+    assert aseq1 == expected_align1
+    assert aseq2 == expected_align2
+
+
+@baseline
+@with_import('alignment')
+def test_edit_distance_fast_path_matches_wavefront(align):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:2000]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:1800]
+    for kwargs in [
+        dict(match_award=0, sub_penalty=1, indel_penalty=1),
+        dict(match_award=-2, sub_penalty=0, indel_penalty=1),
+        dict(match_award=-1, sub_penalty=1, indel_penalty=1.5),
+    ]:
+        assert align(seq1, seq2, **kwargs) == align(seq1, seq2, engine='wavefront', **kwargs)
+        assert align('kitten', 'sitting', **kwargs) == align('kitten', 'sitting', engine='wavefront', **kwargs)
+        assert align('ACGT', '', **kwargs) == align('ACGT', '', engine='wavefront', **kwargs)
+
+    assert align('kitten', 'sitting', match_award=0, sub_penalty=1, indel_penalty=1)[0] == 3
+
+
+# -------------------------------- Core tests -------------------------------- #
+@core
+@with_import('alignment')
+def test_small_dna_alignment_banded(align):
+    score, aseq1, aseq2 = align('GGGGTTTTAAAACCCCTTTT', 'TTTTAAAACCCCTTTTGGGG', banded_width=2)
+    assert score == 6
+    assert aseq1 == 'GGGGTTTTAAAACCCCTT--TT'
+    assert aseq2 == '--TTTTAAAACCCCTTTTGGGG'
+
+
+@core
+@with_import('alignment')
+def test_length_discrepancy_banded(align):
+    score, aseq1, aseq2 = align('AAAA', 'AAAHHHAHHHHHHHHHHHHHHHHHH', banded_width=2)
+    assert score == math.inf
+    assert aseq1 == None
+    assert aseq2 == None
+
+
+@core
+@with_import('alignment')
+def test_alignment_changes_with_banded_width(align):
+    # banded width 1
+    score_narrow, a1_narrow, a2_narrow = align('tcgctcatatatccc', 'atataccctggggtg', banded_width=1, match_award=-1,
+                                               sub_penalty=1, indel_penalty=1)
+    assert score_narrow == 10
+    assert a1_narrow == '-tcgctcatatatccc'
+    assert a2_narrow == 'atataccct-ggggtg'
+
+    # banded width 2
+    score_mid, a1_mid, a2_mid = align('tcgctcatatatccc', 'atataccctggggtg', banded_width=2, match_award=-1,
+                                      sub_penalty=1, indel_penalty=1)
+    assert score_mid == 8
+    assert a1_mid == '-t-cgctcat-atatccc'
+    assert a2_mid == 'atatac-cctggggt--g'
+
+    # banded width 7
+    score_wide, a1_wide, a2_wide = align("tcgctcatatatccc", "atataccctggggtg", banded_width=7, match_award=-1,
+                                         sub_penalty=1, indel_penalty=1)
+    assert score_wide == 6
+    assert a1_wide == 'tcgctcatatatccc-------'
+    assert a2_wide == '------atata-ccctggggtg'
+
+
+@core
+@with_import('alignment')
+def test_medium_dna_alignment_banded(align):
+    seq1 = 'ataagagtgattggcgatatcggctccgtacgtaccctttctactctcgggctcttccccgttagtttaaatctaatctctttataaacggcacttcc'
+    seq2 = 'ataagagtgattggcgtccgtacgtaccctttctactctcaaactcttgttagtttaaatctaatctaaactttataaacggcacttcctgtgtgtccat'
+
+    score, aseq1, aseq2 = align(seq1, seq2, banded_width=2)
+
+    expected_align1 = 'ataagagtgattggcg-atatcggctccgtacgtaccctttctactctcgggctcttccccgttagtttaaatctaatctctttataaacggcacttcc--'
+    expected_align2 = 'ataagagtgattggcgtccgtacgtaccctttctactc-tcaaactcttgttagtttaaatctaatctaaactttataaacggcacttcctgtgtgtccat'
+
+    assert score == -79
+    assert aseq1 == expected_align1
+    assert aseq2 == expected_align2
+
+
+@core
+@with_import('alignment')
+def test_massive_dna_alignment_banded(align):
+    timer = Timer()
+    for N in [10, 100, 1000, 10000, 20000, 25000, 31000]:
+        timer.start_lap()
+        seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:N]
+        seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:N]
+
+        score, aseq1, aseq2 = align(seq1, seq2, banded_width=3)
+
+        with open(test_files / f'massive_bovine_murine_align_{N}.txt') as file:
+            expected_score, expected_align1, expected_align2 = file.read().splitlines()
+
+        assert score == int(expected_score)
+        assert aseq1 == expected_align1
+        assert aseq2 == expected_align2
+
+        if timer.lap_time() > 10:
+            pytest.fail(f"The unrestricted alignment of size {N} took too long")
+
+
+# ------------------------------ Stretch 2 tests ----------------------------- #
+@stretch2
+@with_import('alignment')
+def test_small_dna_alignment_open_gap(align):
+    score, aseq1, aseq2 = align('GGGGTTTTAAAACCCCTTTT', 'TTTTAAAACCCCTTTTGGGG', gap_open_penalty=10, indel_penalty=.5)
+    assert score == -24
+    assert aseq1 == 'GGGGTTTTAAAACCCCTTTT----'
+    assert aseq2 == '----TTTTAAAACCCCTTTTGGGG'
+
+
+@stretch2
+@with_import('alignment')
+def test_small_dna_alignment_gap_open(align):
+    score, seq1, seq2 = align('tcgctcatatatccc', 'atataccctggggtg', gap_open_penalty=10, indel_penalty=.5)
+    assert score == 7
+    assert seq1 == 'tcgctcatatatcc------c'
+    assert seq2 == '------atataccctggggtg'
+
+
+# The expected values below came from a single-matrix approximation that
+# charges gap_open_penalty whenever the previous cell's direction differs.
+# The Gotoh engine finds strictly cheaper alignments for these inputs, so
+# they stay disabled; see the optimality tests that follow.
 # @stretch2
 # @with_import('alignment')
 # def test_medium_dna_alignment_gap_open(align):
@@ -356,3 +473,600 @@ def test_large_dna_alignment(align):
 #     assert score == int(expected_score)
 #     assert aseq1 == expected_align1
 #     assert aseq2 == expected_align2
+
+
+@stretch2
+@with_import('alignment')
+def test_medium_dna_alignment_gap_open_is_optimal(align):
+    seq1 = 'ataagagtgattggcgatatcggctccgtacgtaccctttctactctcgggctcttccccgttagtttaaatctaatctctttataaacggcacttcc'
+    seq2 = 'ataagagtgattggcgtccgtacgtaccctttctactctcaaactcttgttagtttaaatctaatctaaactttataaacggcacttcctgtgtgtccat'
+
+    for gap_open_penalty, reference_score in [(2, -221), (5, -197), (10, -177)]:
+        score, aseq1, aseq2 = align(seq1, seq2, gap_open_penalty=gap_open_penalty, indel_penalty=.5)
+        assert score <= reference_score
+        assert score == score_alignment(aseq1, aseq2, gap_open_penalty=gap_open_penalty, indel_penalty=.5)
+        assert aseq1.replace('-', '') == seq1
+        assert aseq2.replace('-', '') == seq2
+
+    score, _, _ = align(seq1, seq2, gap_open_penalty=10, indel_penalty=.5)
+    assert score == -193
+
+
+@stretch2
+@with_import('alignment')
+def test_large_alignment_open_gap_is_optimal(align):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:1000]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:1000]
+
+    score, aseq1, aseq2 = align(seq1, seq2, gap_open_penalty=10, indel_penalty=.5)
+
+    with open(test_files / f'large_bovine_murine_open_gap_1000.txt') as file:
+        reference_score = int(file.read().splitlines()[0])
+
+    assert score <= reference_score
+    assert score == score_alignment(aseq1, aseq2, gap_open_penalty=10, indel_penalty=.5)
+
+
+@stretch2
+@with_import('alignment')
+def test_gap_open_banded(align):
+    seq1 = 'tcgctcatatatccc'
+    seq2 = 'atataccctggggtg'
+
+    assert align(seq1, seq2, gap_open_penalty=10, indel_penalty=.5, banded_width=15) == \
+           align(seq1, seq2, gap_open_penalty=10, indel_penalty=.5)
+
+    score, aseq1, aseq2 = align(seq1, seq2, gap_open_penalty=10, indel_penalty=.5, banded_width=2)
+    assert score == score_alignment(aseq1, aseq2, gap_open_penalty=10, indel_penalty=.5)
+    assert all(abs(aseq1[:i].count('-') - aseq2[:i].count('-')) <= 2 for i in range(len(aseq1)))
+
+    assert align('AAAA', 'AAAHHHAHHHHHH', gap_open_penalty=10, banded_width=2) == (math.inf, None, None)
+
+
+@stretch2
+@with_import('alignment')
+def test_massive_dna_alignment_banded_gap_open(align):
+    timer = Timer()
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:31000]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:31000]
+
+    score, aseq1, aseq2 = align(seq1, seq2, banded_width=3, gap_open_penalty=10, indel_penalty=.5)
+
+    assert score == score_alignment(aseq1, aseq2, gap_open_penalty=10, indel_penalty=.5)
+    assert aseq1.replace('-', '') == seq1
+    assert aseq2.replace('-', '') == seq2
+    assert timer.time() < 10
+
+
+# ------------------------------ Score-only tests ----------------------------- #
+@baseline
+@with_import('alignment')
+def test_score_only_matches_align(align_score):
+    assert align_score('polynomial', 'exponential') == -1
+    assert align_score('ATGCATGC', 'ATGGTGC') == -12
+    assert align_score('', '') == 0
+    assert align_score('ACGT', '') == 20
+    assert align_score('ABDE', 'BADE', match_award=-2, sub_penalty=4, indel_penalty=5) == 4
+    assert align_score('AAAA', 'CCCC', match_award=-1, indel_penalty=1, sub_penalty=5) == 8
+
+    seq1 = 'ataagagtgattggcgatatcggctccgtacgtaccctttctactctcgggctcttccccgttagtttaaatctaatctctttataaacggcacttcc'
+    seq2 = 'ataagagtgattggcgtccgtacgtaccctttctactctcaaactcttgttagtttaaatctaatctaaactttataaacggcacttcctgtgtgtccat'
+    assert align_score(seq1, seq2) == -116
+    assert align_score(seq2, seq1) == -116
+    assert align_score(seq1, seq2, banded_width=2) == -79
+    assert align_score(seq1, seq2, gap_open_penalty=10, indel_penalty=.5) == -193
+    assert align_score(seq1, seq2, match_award=0, sub_penalty=1, indel_penalty=1) == 29
+
+
+@core
+@with_import('alignment')
+def test_score_only_banded(align_score):
+    assert align_score('GGGGTTTTAAAACCCCTTTT', 'TTTTAAAACCCCTTTTGGGG', banded_width=2) == 6
+    assert align_score('AAAA', 'AAAHHHAHHHHHHHHHHHHHHHHHH', banded_width=2) == math.inf
+    assert align_score('tcgctcatatatccc', 'atataccctggggtg', banded_width=1, match_award=-1,
+                       sub_penalty=1, indel_penalty=1) == 10
+
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:31000]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:31000]
+    with open(test_files / 'massive_bovine_murine_align_31000.txt') as file:
+        expected_score = int(file.readline())
+
+    assert align_score(seq1, seq2, banded_width=3) == expected_score
+
+
+@stretch2
+@with_import('alignment')
+def test_score_only_gap_open(align_score):
+    assert align_score('GGGGTTTTAAAACCCCTTTT', 'TTTTAAAACCCCTTTTGGGG', gap_open_penalty=10, indel_penalty=.5) == -24
+    assert align_score('tcgctcatatatccc', 'atataccctggggtg', gap_open_penalty=10, indel_penalty=.5) == 7
+    assert align_score('tcgctcatatatccc', 'atataccctggggtg', gap_open_penalty=10, indel_penalty=.5,
+                       banded_width=15) == 7
+
+
+# ---------------------------------- Batch tests -------------------------------- #
+@baseline
+@with_import('alignment')
+@with_import('alignment')
+@with_import('alignment')
+def test_align_many_keeps_input_order(align_many, align, align_score):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')
+    pairs = [(seq1[i:i + 40 + i % 7], seq2[i:i + 35]) for i in range(0, 1500, 50)]
+
+    expected = [align(a, b, sub_penalty=2) for a, b in pairs]
+
+    assert list(align_many(pairs, workers=2, chunk_size=4, sub_penalty=2)) == expected
+    assert list(align_many(iter(pairs), workers=1, sub_penalty=2)) == expected
+    assert list(align_many(pairs, workers=2, chunk_size=3, score_only=True, banded_width=5)) == \
+           [align_score(a, b, banded_width=5) for a, b in pairs]
+    assert list(align_many([], workers=2)) == []
+
+
+# --------------------------------- Loader tests -------------------------------- #
+@baseline
+@with_import('sequence_loader')
+def test_read_sequences_multi_record(read_sequences, tmp_path):
+    fasta = tmp_path / 'records.fasta'
+    fasta.write_bytes(b'>first record\r\nACGT\r\nAC\r\n>second\nGG\nTT\n>empty\n>last\nAAA')
+
+    records = read_sequences(fasta)
+    assert next(records) == ('first record', b'ACGTAC')
+    assert list(records) == [('second', b'GGTT'), ('empty', b''), ('last', b'AAA')]
+
+    # blank lines before the first record do not make an empty record of their own
+    for blank in (b'\n', b'\r\n', b'\n\n'):
+        fasta.write_bytes(blank + b'>rec1\nACGT\n')
+        assert list(read_sequences(fasta)) == [('rec1', b'ACGT')]
+    fasta.write_bytes(b'\r\n')
+    assert list(read_sequences(fasta)) == []
+
+    # spaces and tabs inside sequence lines are not residues
+    fasta.write_bytes(b'>r\nAC GT \nT\tT\n')
+    assert list(read_sequences(fasta)) == [('r', b'ACGTTT')]
+
+
+@baseline
+@with_import('alignment')
+@with_import('sequence_loader')
+def test_alignment_accepts_loaded_buffers(load_sequence, align):
+    seq1 = load_sequence(test_files / 'bovine_coronavirus.txt')
+    seq2 = load_sequence(test_files / 'murine_hepatitus.txt')
+    assert seq1 == read_sequence(test_files / 'bovine_coronavirus.txt').encode()
+
+    with open(test_files / 'large_bovine_murine_align_1000.txt') as file:
+        expected_score, expected_align1, expected_align2 = file.read().splitlines()
+
+    for engine in ['full', 'wavefront', 'linear_space']:
+        assert align(seq1[:1000], seq2[:1000], engine=engine) == (int(expected_score), expected_align1, expected_align2)
+
+    assert align(memoryview(seq1)[:100], read_sequence(test_files / 'murine_hepatitus.txt')[:100]) == \
+           align(seq1[:100].decode(), seq2[:100].decode())
+
+
+# ---------------------------- Substitution matrix tests ---------------------------- #
+@baseline
+@with_import('alignment')
+@with_import('alignment')
+@with_import('substitution_matrices')
+def test_transition_transversion_matrix(transition_transversion, align_score, align):
+    matrix = transition_transversion(match_award=-3, transition_penalty=1, transversion_penalty=4)
+    assert matrix[('A', 'G')] == matrix[('C', 'T')] == 1
+    assert matrix[('A', 'C')] == matrix[('G', 'T')] == 4
+
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:400]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:400]
+    score, aligned1, aligned2 = align(seq1, seq2, substitution_matrix=matrix)
+    assert score == score_alignment(aligned1, aligned2, substitution_matrix=matrix)
+    assert score < align(seq1, seq2, sub_penalty=4)[0]
+
+    for engine in ['wavefront', 'linear_space', 'tiled']:
+        assert align(seq1, seq2, engine=engine, workers=2, substitution_matrix=matrix) == \
+               (score, aligned1, aligned2)
+    assert align_score(seq1, seq2, substitution_matrix=matrix) == score
+    assert align_score(seq1.encode(), seq2.encode(), substitution_matrix=matrix) == score
+
+    banded = align(seq1, seq2, banded_width=20, substitution_matrix=matrix)
+    assert banded[0] == align_score(seq1, seq2, banded_width=20, substitution_matrix=matrix)
+    assert banded[0] == score_alignment(banded[1], banded[2], substitution_matrix=matrix)
+
+
+@baseline
+@with_import('alignment')
+@with_import('alignment')
+@with_import('substitution_matrices')
+def test_blosum62_protein_alignment(BLOSUM62, align_score, align):
+    seq1 = 'MKTAYIAKQRQISFVKSHFSRQLEERLGLIEVQAPILSRVGDGTQDNLSGAEKAVQVKVKALPDAQFEVV'
+    seq2 = 'MKTAYIAKQRQISFVKSHFSRQDILDLWIYHTQGYFPDWQNYTPGPGVRYPLTFGWCYKLVPVEPDKV'
+    assert BLOSUM62[('W', 'W')] == -11 and BLOSUM62[('W', 'F')] == -1
+
+    score, aligned1, aligned2 = align(seq1, seq2, indel_penalty=4, substitution_matrix=BLOSUM62)
+    assert score == score_alignment(aligned1, aligned2, indel_penalty=4, substitution_matrix=BLOSUM62)
+    assert align(seq1, seq2, indel_penalty=4, engine='wavefront', substitution_matrix=BLOSUM62) == \
+           (score, aligned1, aligned2)
+    assert align_score(seq2, seq1, indel_penalty=4, substitution_matrix=BLOSUM62) == score
+
+    # lowercase residues use the uppercase entries
+    assert align(seq1.lower(), seq2.lower(), indel_penalty=4, substitution_matrix=BLOSUM62)[0] == score
+
+    score, aligned1, aligned2 = align(seq1, seq2, indel_penalty=1, gap_open_penalty=10,
+                                      substitution_matrix=BLOSUM62)
+    assert score == score_alignment(aligned1, aligned2, indel_penalty=1, gap_open_penalty=10,
+                                    substitution_matrix=BLOSUM62)
+    assert align_score(seq1, seq2, indel_penalty=1, gap_open_penalty=10, substitution_matrix=BLOSUM62) == score
+
+
+# ------------------------------ Local and semi-global tests ------------------------------ #
+@baseline
+@with_import('alignment')
+@with_import('alignment')
+def test_semiglobal_places_read_in_genome(align_score, align):
+    genome = read_sequence(test_files / 'bovine_coronavirus.txt')[:3000]
+    read = genome[1200:1350]
+
+    for engine in ['full', 'wavefront']:
+        result = align(read, genome, mode='semiglobal', engine=engine)
+        assert result == (-3 * len(read), read, read)
+        assert result.region == (0, len(read), 1200, 1350)
+
+    banded = align(read, genome, mode='semiglobal', banded_width=1350)
+    assert banded == result and banded.region == result.region
+    assert align_score(read, genome, mode='semiglobal') == result[0]
+    assert align_score(genome, read, mode='semiglobal', banded_width=1350) == result[0]
+
+
+@baseline
+@with_import('alignment')
+@with_import('alignment')
+def test_local_alignment_finds_best_region(align_score, align):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:500]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:500]
+
+    score, aligned1, aligned2 = result = align(seq1, seq2, mode='local')
+    start1, end1, start2, end2 = result.region
+    assert aligned1.replace('-', '') == seq1[start1:end1]
+    assert aligned2.replace('-', '') == seq2[start2:end2]
+    assert score == score_alignment(aligned1, aligned2)
+    assert score < align(seq1, seq2)[0]
+
+    wavefront = align(seq1, seq2, mode='local', engine='wavefront')
+    assert wavefront == result and wavefront.region == result.region
+    assert align_score(seq1, seq2, mode='local') == score
+    assert align('aaaa', 'cccc', mode='local') == (0, '', '')
+
+    banded = align(seq1, seq2, mode='local', banded_width=20)
+    assert banded[0] == align_score(seq1, seq2, mode='local', banded_width=20) >= score
+
+    with pytest.raises(ValueError):
+        align(seq1, seq2, mode='local', gap_open_penalty=2)
+
+
+# --------------------------------- Seeding tests -------------------------------- #
+@baseline
+@with_import('alignment')
+@with_import('alignment')
+@with_import('alignment')
+def test_auto_band_matches_full_alignment(choose_band, align_score, align):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')
+    with open(test_files / 'large_bovine_murine_align_3000.txt') as file:
+        expected_score, expected_align1, expected_align2 = file.read().splitlines()
+
+    band = choose_band(seq1[:3000], seq2[:3000])
+    assert 0 < band < 3000
+    assert align(seq1[:3000], seq2[:3000], banded_width='auto') == \
+           (int(expected_score), expected_align1, expected_align2)
+    assert align_score(seq1[:10000], seq2[:10000], banded_width='auto') == align_score(seq1[:10000], seq2[:10000])
+
+    # no shared k-mers, or sequences too short to seed, fall back to the full alignment
+    assert choose_band('acgtacgtacgtacgt', 'ttttttttttttttttttt') == -1
+    assert choose_band('acgt', 'acgt') == -1
+
+
+# ---------------------------------- X-drop tests -------------------------------- #
+@baseline
+@with_import('alignment')
+def test_xdrop_follows_alignment(align):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')
+    with open(test_files / 'large_bovine_murine_align_3000.txt') as file:
+        expected_score, expected_align1, expected_align2 = file.read().splitlines()
+
+    result = align(seq1[:3000], seq2[:3000], engine='xdrop', x_drop=200)
+    assert result == (int(expected_score), expected_align1, expected_align2)
+    assert result.cells < align(seq1[:3000], seq2[:3000], banded_width=77).cells < \
+           align(seq1[:3000], seq2[:3000], engine='wavefront').cells == 3000 * 3000
+
+    # A tight X-drop is a heuristic: never better than the optimum
+    assert align(seq1[:3000], seq2[:3000], engine='xdrop', x_drop=25)[0] >= int(expected_score)
+
+    # With nothing dropped it is the wavefront engine
+    for pair in [('ATGCATGC', 'ATGGTGC'), ('polynomial', 'exponential'), ('', 'acgt')]:
+        unbounded = align(*pair, engine='xdrop', x_drop=math.inf)
+        assert unbounded == align(*pair, engine='wavefront')
+        assert unbounded.cells == len(pair[0]) * len(pair[1])
+
+
+# ---------------------------------- Cache tests --------------------------------- #
+@baseline
+@with_import('alignment_cache')
+def test_cache_counts_hits_and_misses(AlignmentCache):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:300]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:300]
+    cache = AlignmentCache(max_entries=2)
+
+    first = cache.align(seq1, seq2)
+    assert cache.align(seq1, seq2, match_award=-3, workers=4) is first
+    assert cache.align(seq1, seq2, sub_penalty=2) != first
+    assert cache.align_score(seq1, seq2) == first[0]
+    assert cache.stats() == {'hits': 1, 'disk_hits': 0, 'misses': 3, 'entries': 2}
+
+    # the oldest entry was evicted
+    cache.align(seq1, seq2)
+    assert cache.misses == 4
+
+    # profiled calls always run, so their timings are their own
+    profiled = cache.align(seq1, seq2, profile=True)
+    assert profiled == first and profiled.phases is not None
+    assert cache.align(seq1, seq2, profile=True).phases is not profiled.phases
+    assert cache.align(seq1, seq2).phases is None
+    assert cache.stats() == {'hits': 2, 'disk_hits': 0, 'misses': 4, 'entries': 2}
+
+
+@baseline
+@with_import('alignment_cache')
+def test_cache_shares_disk_store(AlignmentCache, tmp_path):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:300]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:300]
+
+    writer = AlignmentCache(directory=tmp_path)
+    expected = writer.align(seq1, seq2, mode='local')
+    reader = AlignmentCache(directory=tmp_path)
+    result = reader.align(seq1, seq2, mode='local')
+
+    assert result == expected and result.region == expected.region
+    assert (reader.hits, reader.disk_hits, reader.misses) == (1, 1, 0)
+    assert reader.align(seq1.encode(), seq2.encode(), mode='local') == expected
+    assert reader.misses == 1
+    assert not list(tmp_path.rglob('*.tmp'))
+
+
+# ------------------------------- Traceback tests ------------------------------- #
+@baseline
+@with_import('alignment')
+def test_packed_traceback_round_trip(PackedTraceback):
+    import numpy as np
+
+    codes1 = np.array([0, 1, 2], dtype=np.uint8)
+    codes2 = np.array([0, 2, 2, 1, 0, 1, 1], dtype=np.uint8)
+    traceback = PackedTraceback(codes1, codes2)
+    assert traceback.packed.nbytes == 4 * 2
+
+    rows = [[0, 2, 2, 2, 2, 2, 2, 2], [3, 1, 2, 1, 3, 1, 2, 1], [3, 3, 1, 1, 2, 2, 1, 1], [3, 1, 1, 1, 1, 1, 3, 2]]
+    for row, directions in enumerate(rows):
+        traceback.setRow(row, np.array(directions, dtype=np.uint8))
+    for row, directions in enumerate(rows):
+        for col, direction in enumerate(directions):
+            is_match = direction == 1 and codes1[row - 1] == codes2[col - 1]
+            assert traceback[row, col] == direction | (4 if is_match else 0)
+
+    # anti-diagonal writes, as the wavefront engine makes them
+    traceback = PackedTraceback(codes1, codes2)
+    traceback.setCells(np.array([1, 2, 3]), np.array([6, 5, 4]), np.array([2, 3, 1]))
+    assert [traceback[1, 6], traceback[2, 5], traceback[3, 4], traceback[3, 5]] == [2, 3, 1, 0]
+
+
+@baseline
+@with_import('alignment')
+@with_import('alignment')
+@with_import('alignment')
+def test_cigar_and_streamed_output(align, aligned_chunks, write_alignment):
+    import io
+
+    seq1 = 'polynomial'
+    seq2 = 'exponential'
+    result = align(seq1, seq2)
+    assert result.cigar == '4X1=1I2X3='
+    assert result.region == (0, 10, 0, 11)
+
+    chunks = list(aligned_chunks(seq1, seq2, result.cigar, result.region, chunk_size=3))
+    assert all(len(chunk1) == len(chunk2) == 3 for chunk1, chunk2 in chunks[:-1])
+    assert ''.join(chunk for chunk, _ in chunks) == result[1]
+    assert ''.join(chunk for _, chunk in chunks) == result[2]
+
+    compact = align(seq1.encode(), seq2.encode(), output='cigar')
+    assert compact == (result[0], None, None) and compact.cigar == result.cigar
+
+    buffer = io.StringIO()
+    write_alignment(buffer, seq1, seq2, compact, width=6)
+    assert buffer.getvalue() == 'polyn-\nexpone\n\nomial\nntial\n\n'
+
+
+# ------------------------------ Checkpoint tests ------------------------------ #
+@baseline
+@with_import('alignment')
+def test_tiled_checkpoint_resumes(align, tmp_path, monkeypatch):
+    import alignment
+
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:1000]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:1000]
+    expected = align(seq1, seq2)
+
+    class Interrupted(Exception):
+        pass
+
+    computeTile = alignment.computeTile
+    computed = []
+    interruptAt = [7]
+
+    def interruptedTile(*args):
+        if len(computed) in interruptAt:
+            raise Interrupted
+        computed.append(args)
+        computeTile(*args)
+
+    monkeypatch.setattr(alignment, 'CHECKPOINT_SECONDS', 0)
+    monkeypatch.setattr(alignment, 'computeTile', interruptedTile)
+    with pytest.raises(Interrupted):
+        align(seq1, seq2, engine='tiled', workers=1, checkpoint_dir=tmp_path)
+    # 4 x 4 tiles: the first three block anti-diagonals hold 1 + 2 + 3 tiles
+    assert (tmp_path / 'progress.json').exists()
+
+    computed.clear()
+    interruptAt.clear()
+    result = align(seq1, seq2, engine='tiled', workers=1, checkpoint_dir=tmp_path)
+    assert len(computed) == 16 - 6
+    assert result == expected and result.cigar == expected.cigar
+    assert not list(tmp_path.iterdir())
+
+
+# ------------------------------- Max cost tests ------------------------------- #
+@baseline
+@with_import('alignment')
+@with_import('alignment')
+def test_max_cost_screens_alignments(align_score, align):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:1000]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:1000]
+    expected = align(seq1, seq2)
+    assert expected[0] == -1448
+
+    for params in ({}, {'engine': 'wavefront'}, {'banded_width': 30}, {'engine': 'linear_space'}):
+        assert align(seq1, seq2, max_cost=-1448, **params) == align(seq1, seq2, **params)
+        rejected = align(seq1, seq2, max_cost=-1449, **params)
+        assert rejected == (math.inf, None, None) and rejected.region is None
+    assert align_score(seq1, seq2, max_cost=-1448) == -1448
+    assert align_score(seq1, seq2, max_cost=-1449) == math.inf
+
+    # a bound far below the optimum is given up on long before the last row
+    assert align(seq1, seq2, max_cost=-2000).cells < 0.7 * 1000 * 1000
+    assert align(seq1, seq2, engine='wavefront', max_cost=-3000).cells < 1000
+
+    # unit costs take the edit-distance path, which checks the bound as it goes too
+    unit = {'match_award': 0, 'indel_penalty': 1, 'sub_penalty': 1}
+    distance = align(seq1, seq2, **unit)[0]
+    assert align(seq1, seq2, max_cost=distance, **unit) == align(seq1, seq2, **unit)
+    assert align_score(seq1, seq2, max_cost=distance - 1, **unit) == math.inf
+    rejected = align(seq1, seq2, max_cost=distance // 4, **unit)
+    assert rejected[0] == math.inf and rejected.cells < 0.5 * 1000 * 1000
+
+
+# ----------------------------- Four-Russians tests ----------------------------- #
+@baseline
+@with_import('alignment')
+@with_import('alignment')
+@with_import('alignment')
+def test_four_russians_matches_score_only(align_score, align, FOUR_RUSSIANS_TABLES):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:1000]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:998]
+
+    # a substitution priced as two gaps, as one gap (an edit distance) and as a match
+    for sub_penalty in (10, 1, -3):
+        match_award = -8 if sub_penalty == 1 else -3
+        expected = align(seq1, seq2, match_award=match_award, sub_penalty=sub_penalty)[0]
+        assert align_score(seq1, seq2, match_award=match_award, sub_penalty=sub_penalty,
+                           engine='four_russians') == expected
+    assert align_score(seq2, seq1[:500], sub_penalty=10, engine='four_russians') == \
+        align_score(seq2, seq1[:500], sub_penalty=10)
+
+    # the block tables are built once per substitution weight
+    tables = FOUR_RUSSIANS_TABLES[2]
+    align_score(seq1[:30], seq2[:30], indel_penalty=4, sub_penalty=9, engine='four_russians')
+    assert FOUR_RUSSIANS_TABLES[2] is tables
+
+    with pytest.raises(ValueError):
+        align_score(seq1, seq2, engine='four_russians')
+    with pytest.raises(ValueError):
+        align_score(seq1, seq2, sub_penalty=10, banded_width=3, engine='four_russians')
+
+
+# ------------------------------- Profiling tests ------------------------------- #
+@baseline
+@with_import('alignment')
+def test_profile_records_phases(align):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:500]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:500]
+
+    assert align(seq1, seq2).phases is None
+    result = align(seq1, seq2, engine='wavefront', profile=True)
+    assert result == align(seq1, seq2, engine='wavefront')
+    assert list(result.phases) == ['setup', 'costs', 'traceback', 'output']
+    assert all(phase['seconds'] >= 0 and 'peak_memory_bytes' not in phase for phase in result.phases.values())
+    assert result.phases['costs']['cells_per_second'] > 0
+
+    traced = align(seq1, seq2, engine='wavefront', profile='memory')
+    # the 2-bit traceback is allocated in setup
+    assert traced.phases['setup']['peak_memory_bytes'] >= 501 * 126
+
+    rejected = align(seq1, seq2, max_cost=-5000, profile=True)
+    assert rejected[0] == math.inf and list(rejected.phases) == ['setup', 'costs']
+
+
+# ------------------------------ Incremental tests ------------------------------ #
+@baseline
+@with_import('alignment')
+@with_import('incremental_alignment')
+def test_incremental_aligner_follows_growing_seq2(IncrementalAligner, align):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')[:500]
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')[:500]
+
+    aligner = IncrementalAligner(seq1, seq2[:100])
+    for end in range(100, 501, 80):
+        aligner.extend(seq2[len(aligner.seq2):end])
+        expected = align(seq1, seq2[:end])
+        result = aligner.result()
+        assert aligner.score == expected[0]
+        assert result == expected and result.cigar == expected.cigar
+    # each column was computed once
+    assert aligner.cells == 500 * 500
+
+    # residues new to the alignment extend the scoring table
+    aligner = IncrementalAligner('polynomial', 'exp')
+    aligner.extend('onential')
+    assert aligner.result() == align('polynomial', 'exponential')
+
+
+# ----------------------------- Query profile tests ----------------------------- #
+@baseline
+@with_import('alignment')
+@with_import('query_profile')
+def test_query_profile_scan_top_hits(QueryProfile, align_score):
+    genome = read_sequence(test_files / 'bovine_coronavirus.txt')
+    other = read_sequence(test_files / 'murine_hepatitus.txt')
+    query = genome[1000:1200]
+    targets = [genome[start:start + 150 + start % 97] for start in range(0, 6000, 173)]
+    targets += [other[start:start + 180] for start in range(0, 3000, 211)]
+
+    for mode in ('global', 'local', 'semiglobal'):
+        profile = QueryProfile(query, mode=mode)
+        expected = sorted((align_score(query, target, mode=mode), index) for index, target in enumerate(targets))
+        assert profile.scan(targets, top_k=5, batch_size=8) == [(index, score) for score, index in expected[:5]]
+        assert profile.score(targets[3]) == align_score(query, targets[3], mode=mode)
+
+    # the target holding the query is the best local hit
+    assert QueryProfile(query, mode='local').scan(iter(targets), top_k=1)[0][0] == 6
+
+
+# ---------------------------- Multiple alignment tests ---------------------------- #
+@baseline
+@with_import('multiple_alignment')
+def test_guide_tree_joins_closest_first(guide_tree):
+    import numpy as np
+
+    distances = np.array([[0, 2, 6, 10], [2, 0, 6, 10], [6, 6, 0, 10], [10, 10, 10, 0]], dtype=float)
+    assert guide_tree(distances) == [(0, 1), (2, 4), (3, 5)]
+
+
+@baseline
+@with_import('alignment')
+@with_import('multiple_alignment')
+def test_align_multiple_family(align_multiple, align):
+    seq1 = read_sequence(test_files / 'bovine_coronavirus.txt')
+    seq2 = read_sequence(test_files / 'murine_hepatitus.txt')
+
+    # two sequences align exactly as the pairwise alignment does
+    expected = align(seq1[:500], seq2[:500])
+    assert align_multiple([seq1[:500], seq2[:500]], workers=1) == [expected[1], expected[2]]
+
+    family = [seq1[:400], seq2[:400], seq1[30:420], seq2[10:400], seq1[:200] + seq1[250:450]]
+    rows = align_multiple(family, workers=2)
+    assert len({len(row) for row in rows}) == 1
+    assert [row.replace('-', '') for row in rows] == family
@@ -16,4 +16,23 @@ class Timer:
         self._lap_time = time.time()
 
     def timed_out(self):
-        return (time.time() - self._start_time) > self._time_limit
\ No newline at end of file
+        return (time.time() - self._start_time) > self._time_limit
+
+
+def score_alignment(aseq1: str, aseq2: str, match_award=-3, indel_penalty=5, sub_penalty=1, gap_open_penalty=0,
+                    gap='-', substitution_matrix=None) -> float:
+    """ Score a pair of aligned strings; each run of gaps costs gap_open_penalty once. """
+    score = 0
+    previous = None
+    for a, b in zip(aseq1, aseq2):
+        if a == gap or b == gap:
+            state = 'insert' if a == gap else 'delete'
+            score += indel_penalty + (gap_open_penalty if state != previous else 0)
+        else:
+            state = 'match'
+            default = match_award if a == b else sub_penalty
+            if substitution_matrix:
+                default = substitution_matrix.get((a, b), substitution_matrix.get((a.upper(), b.upper()), default))
+            score += default
+        previous = state
+    return score